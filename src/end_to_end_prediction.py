@@ -12,6 +12,7 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 import json
+from fpl_player_prep import load_bt_matrix, load_player_mappings
 import subprocess
 from datetime import datetime
 
@@ -113,9 +114,8 @@ class EndToEndFPLPredictor:
         suffix = f"weeks_1_to_{based_on_weeks}"
         
         # Load player Bradley-Terry matrix
-        player_matrix = np.load(bt_dir / f"bt_matrix_{suffix}.npy")
-        with open(bt_dir / f"player_mappings_{suffix}.json", 'r') as f:
-            player_mappings = json.load(f)
+        player_matrix = load_bt_matrix(bt_dir, suffix)
+        player_mappings = load_player_mappings(bt_dir, suffix)
             
         # Load team Bradley-Terry matrix
         team_matrix = np.load(team_bt_dir / f"team_bt_matrix_{suffix}.npy")
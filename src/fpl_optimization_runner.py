@@ -8,22 +8,62 @@ Example: python src/fpl_optimization_runner.py data/2024/pred_2024_week_sampling
 """
 
 import sys
+import heapq
+from operator import attrgetter
 import pandas as pd
 import numpy as np
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from pred_optimized_fixed import Player, OptimizedFantasyOptimizer
+from fpl_player_prep import CSV_ENGINE
 
 
-def load_prediction_data(pred_csv_path, max_gameweek=None):
-    """Load prediction data and aggregate scores for gameweeks"""
-    df = pd.read_csv(pred_csv_path)
+# Per-process scorer used by _score_team (set up by _init_scorer)
+_scorer = None
+
+
+def _init_scorer(budget):
+    """Create a lightweight optimizer in each worker for best-11 scoring"""
+    global _scorer
+    _scorer = OptimizedFantasyOptimizer([], budget)
+
+
+def _score_team(candidate):
+    """Find the best 11 for one (team_15, total_price) candidate"""
+    team_15, _ = candidate
+    return _scorer._find_best_11_from_15_optimized(team_15)
+
+
+def load_prediction_data(pred_csv_path, max_gameweek=None, valid_roles=None):
+    """Load prediction data and aggregate scores for gameweeks
+    
+    If valid_roles is given, rows with other roles are dropped before aggregating.
+    """
+    # Only parse the columns used, reading the grouping keys as categoricals
+    # so groupby works on integer codes
+    df = pd.read_csv(
+        pred_csv_path,
+        usecols=['first_name', 'last_name', 'club', 'role', 'gameweek', 'average_score', 'price'],
+        dtype={
+            'first_name': 'category',
+            'last_name': 'category',
+            'club': 'category',
+            'role': 'category',
+            'gameweek': 'int16'
+        },
+        engine=CSV_ENGINE
+    )
     
     # Filter to max gameweek if specified
     if max_gameweek is not None:
         df = df[df['gameweek'] <= max_gameweek]
     
+    # Filter out players with unknown role before grouping (smaller input)
+    if valid_roles is not None:
+        df = df[df['role'].isin(valid_roles)]
+    
     # Group by player and aggregate
-    player_data = df.groupby(['first_name', 'last_name', 'club', 'role']).agg({
+    player_data = df.groupby(['first_name', 'last_name', 'club', 'role'], observed=True).agg({
         'average_score': 'mean',  # Average of the average scores
         'price': 'last'  # Last known price
     }).reset_index()
@@ -32,29 +72,27 @@ def load_prediction_data(pred_csv_path, max_gameweek=None):
     player_data['player_id'] = player_data.index
     
     # Create full name for display
-    player_data['full_name'] = player_data['first_name'] + ' ' + player_data['last_name']
+    player_data['full_name'] = player_data['first_name'].astype(str) + ' ' + player_data['last_name'].astype(str)
     
     return player_data
 
 
 def create_optimizer_players(player_data):
     """Convert dataframe to Player objects for optimizer"""
-    players = []
-    
-    for _, row in player_data.iterrows():
-        # Skip players with invalid data
-        if pd.isna(row['average_score']) or pd.isna(row['price']) or row['price'] <= 0:
-            continue
-            
-        player = Player(
-            id=row['player_id'],
-            score=row['average_score'],
-            price=row['price'],
-            role=row['role'],
-            team=row['club']
-        )
-        players.append(player)
-    
+    ids = player_data['player_id'].to_numpy()
+    scores = player_data['average_score'].to_numpy(dtype=float)
+    prices = player_data['price'].to_numpy(dtype=float)
+    roles = player_data['role'].to_numpy()
+    teams = player_data['club'].to_numpy()
+
+    # Skip players with invalid data
+    valid = ~(np.isnan(scores) | np.isnan(prices)) & (prices > 0)
+
+    players = [
+        Player(id=i, score=s, price=p, role=r, team=t)
+        for i, s, p, r, t in zip(ids[valid], scores[valid], prices[valid], roles[valid], teams[valid])
+    ]
+
     return players
 
 
@@ -62,59 +100,60 @@ def format_results_to_dataframe(results, player_data):
     """Convert optimizer results to requested dataframe format"""
     formatted_results = []
     
-    # Create player lookup
-    player_lookup = player_data.set_index('player_id').to_dict('index')
+    # Create player lookup: display labels by position, which is the player_id
+    labels = (player_data['full_name'] + ' (' + player_data['club'].astype(str) + ')').to_numpy()
+    
+    # Role buckets are reused across teams
+    team_by_role = {'GK': [], 'DEF': [], 'MID': [], 'FWD': []}
+    by_score = attrgetter('score')
     
     for result in results:
         row = {}
         
         # Group players by role in team_15
-        team_by_role = {'GK': [], 'DEF': [], 'MID': [], 'FWD': []}
+        for bucket in team_by_role.values():
+            bucket.clear()
         for player in result['team_15']:
             team_by_role[player.role].append(player)
         
         # Sort each role by score (best first)
-        for role in team_by_role:
-            team_by_role[role].sort(key=lambda p: p.score, reverse=True)
+        for bucket in team_by_role.values():
+            bucket.sort(key=by_score, reverse=True)
         
         # Check which players are in best 11
         best_11_ids = {p.id for p in result['best_11']}
         
         # Add goalkeepers
         for i, player in enumerate(team_by_role['GK'][:2], 1):
-            player_info = player_lookup[player.id]
-            row[f'GK{i}'] = f"{player_info['full_name']} ({player_info['club']})"
+            row[f'GK{i}'] = labels[player.id]
             row[f'GK{i}_selected'] = 1 if player.id in best_11_ids else 0
-            row[f'GK{i}_price'] = round(player.price, 1)
-            row[f'GK{i}_score'] = round(player.score, 4)
+            row[f'GK{i}_price'] = player.price
+            row[f'GK{i}_score'] = player.score
         
         # Add defenders
         for i, player in enumerate(team_by_role['DEF'][:5], 1):
-            player_info = player_lookup[player.id]
-            row[f'DEF{i}'] = f"{player_info['full_name']} ({player_info['club']})"
+            row[f'DEF{i}'] = labels[player.id]
             row[f'DEF{i}_selected'] = 1 if player.id in best_11_ids else 0
-            row[f'DEF{i}_price'] = round(player.price, 1)
-            row[f'DEF{i}_score'] = round(player.score, 4)
+            row[f'DEF{i}_price'] = player.price
+            row[f'DEF{i}_score'] = player.score
         
         # Add midfielders
         for i, player in enumerate(team_by_role['MID'][:5], 1):
-            player_info = player_lookup[player.id]
-            row[f'MID{i}'] = f"{player_info['full_name']} ({player_info['club']})"
+            row[f'MID{i}'] = labels[player.id]
             row[f'MID{i}_selected'] = 1 if player.id in best_11_ids else 0
-            row[f'MID{i}_price'] = round(player.price, 1)
-            row[f'MID{i}_score'] = round(player.score, 4)
+            row[f'MID{i}_price'] = player.price
+            row[f'MID{i}_score'] = player.score
         
         # Add forwards
         for i, player in enumerate(team_by_role['FWD'][:3], 1):
-            player_info = player_lookup[player.id]
-            row[f'FWD{i}'] = f"{player_info['full_name']} ({player_info['club']})"
+            row[f'FWD{i}'] = labels[player.id]
             row[f'FWD{i}_selected'] = 1 if player.id in best_11_ids else 0
-            row[f'FWD{i}_price'] = round(player.price, 1)
-            row[f'FWD{i}_score'] = round(player.score, 4)
+            row[f'FWD{i}_price'] = player.price
+            row[f'FWD{i}_score'] = player.score
         
         # Add totals
-        row['11_selected_total_scores'] = round(result['best_11_score'], 2)
-        row['15_total_price'] = round(result['total_price'], 2)
+        row['11_selected_total_scores'] = result['best_11_score']
+        row['15_total_price'] = result['total_price']
         
         formatted_results.append(row)
     
@@ -130,7 +169,12 @@ def format_results_to_dataframe(results, player_data):
         columns.extend([f'FWD{i}', f'FWD{i}_selected', f'FWD{i}_price', f'FWD{i}_score'])
     columns.extend(['11_selected_total_scores', '15_total_price'])
     
-    return pd.DataFrame(formatted_results, columns=columns)
+    # Round whole columns once instead of every cell (totals override the '_price' match)
+    decimals = ({col: 1 for col in columns if col.endswith('_price')} |
+                {col: 4 for col in columns if col.endswith('_score')} |
+                {'11_selected_total_scores': 2, '15_total_price': 2})
+    
+    return pd.DataFrame(formatted_results, columns=columns).round(decimals)
 
 
 def main():
@@ -148,17 +192,12 @@ def main():
         sys.exit(1)
     
     print(f"Loading prediction data from {pred_csv_path}...")
-    player_data = load_prediction_data(pred_csv_path)
-    
-    print(f"Found {len(player_data)} unique players")
-    print(f"Role distribution:")
-    print(player_data['role'].value_counts())
-    
-    # Filter out players with unknown role
     valid_roles = ['GK', 'DEF', 'MID', 'FWD']
-    player_data = player_data[player_data['role'].isin(valid_roles)]
+    player_data = load_prediction_data(pred_csv_path, valid_roles=valid_roles)
     
-    print(f"\nAfter filtering: {len(player_data)} players with valid roles")
+    print(f"Found {len(player_data)} unique players with valid roles")
+    print(f"Role distribution:")
+    print(player_data['role'].value_counts().reindex(valid_roles, fill_value=0))
     
     # Create Player objects
     players = create_optimizer_players(player_data)
@@ -178,13 +217,20 @@ def main():
     try:
         # Generate candidate teams with larger beam width to find valid teams with team constraint
         # Use smaller beam width for faster processing with large datasets
-        candidate_teams = optimizer._generate_top_teams_beam_search(beam_width=500, max_results=1000)
+        # Each hypothesis picks a role's players from only its most efficient (score/price)
+        # candidates, enough for 4 * beam_width combinations, and keeps the best
+        # 4 * beam_width valid expansions by total player score
+        beam_width = 500
+        candidate_teams = optimizer._generate_top_teams_beam_search(
+            beam_width=beam_width, max_results=1000, per_hyp_expansions=4 * beam_width
+        )
         
         if candidate_teams:
-            # Evaluate each team
-            for team_15, total_price in candidate_teams:
-                best_11, best_score = optimizer._find_best_11_from_15_optimized(team_15)
-                
+            # Evaluate each team (independent, so spread across processes)
+            with ProcessPoolExecutor(initializer=_init_scorer, initargs=(budget,)) as ex:
+                best_tuples = list(ex.map(_score_team, candidate_teams, chunksize=32))
+            
+            for (team_15, total_price), (best_11, best_score) in zip(candidate_teams, best_tuples):
                 results.append({
                     'team_15': team_15,
                     'best_11': best_11,
@@ -193,9 +239,8 @@ def main():
                     'price_margin': budget - total_price
                 })
             
-            # Sort by best 11 score
-            results.sort(key=lambda x: x['best_11_score'], reverse=True)
-            results = results[:50]
+            # Keep the top 50 by best 11 score
+            results = heapq.nlargest(50, results, key=lambda x: x['best_11_score'])
     except Exception as e:
         print(f"Error during optimization: {e}")
         results = []
@@ -3,7 +3,7 @@
 FPL Player Bradley-Terry Matrix Preparation
 Builds a Bradley-Terry matrix based on player head-to-head comparisons
 
-Usage: python src/fpl_player_prep.py [YEAR] [PREVIOUS_WEEK] [NEXT_WEEK]
+Usage: python src/fpl_player_prep.py [YEAR] [PREVIOUS_WEEK] [NEXT_WEEK] [--gpu]
 Example: python src/fpl_player_prep.py 2024 9 10
 """
 
@@ -13,6 +13,191 @@ import numpy as np
 from pathlib import Path
 import json
 
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import cupy as cp
+    CUPY_AVAILABLE = True
+except ImportError:
+    CUPY_AVAILABLE = False
+
+try:
+    import scipy.sparse
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import pyarrow  # enables the multithreaded CSV parser and C++ CSV writer
+    import pyarrow.csv
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'c'
+
+
+def _bt_update_numpy(bt_matrix, idx_arr, adj_arr, mult_arr):
+    """Add one gameweek of head-to-head wins to bt_matrix (NumPy fallback)"""
+    wins = (adj_arr[:, None] > adj_arr[None, :]) * np.outer(mult_arr, mult_arr)
+    bt_matrix[np.ix_(idx_arr, idx_arr)] += wins.astype(bt_matrix.dtype)
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _bt_update(bt_matrix, idx_arr, adj_arr, mult_arr):
+        """Add one gameweek of head-to-head wins to bt_matrix
+
+        Each pair is visited once (upper triangle) and a single comparison
+        decides which of the two mirrored cells is incremented. Every cell
+        belongs to exactly one pair, so no atomics are needed.
+        mult_arr counts how many fixtures a player had in the gameweek.
+        """
+        n = len(idx_arr)
+        for i in prange(n):
+            row = idx_arr[i]
+            for j in range(i + 1, n):
+                col = idx_arr[j]
+                if adj_arr[i] > adj_arr[j]:
+                    bt_matrix[row, col] += mult_arr[i] * mult_arr[j]
+                elif adj_arr[j] > adj_arr[i]:
+                    bt_matrix[col, row] += mult_arr[i] * mult_arr[j]
+else:
+    _bt_update = _bt_update_numpy
+
+
+def _bt_update_cupy(bt_matrix, idx_arr, adj_arr, mult_arr):
+    """Add one gameweek of head-to-head wins to a device-resident bt_matrix
+
+    Only the compact per-gameweek vectors are copied to the GPU.
+    """
+    idx = cp.asarray(idx_arr)
+    adj = cp.asarray(adj_arr)
+    mult = cp.asarray(mult_arr)
+    wins = (adj[:, None] > adj[None, :]) * cp.outer(mult, mult)
+    bt_matrix[cp.ix_(idx, idx)] += wins.astype(bt_matrix.dtype)
+
+
+# Matrices with fewer non-zero cells than this are saved sparse (needs SciPy)
+SPARSE_DENSITY = 0.2
+
+
+def load_bt_matrix(bt_dir, suffix, mmap_mode=None):
+    """
+    Load a player Bradley-Terry matrix written by BradleyTerryBuilder.save_results
+    
+    Returns a dense array whether the matrix was saved dense (.npy) or as a
+    sparse CSR matrix (.npz, needs SciPy). mmap_mode is passed to np.load for
+    dense matrices (e.g. 'r' for read-only callers).
+    """
+    sparse_file = bt_dir / f"bt_matrix_{suffix}.npz"
+    if sparse_file.exists():
+        if not SCIPY_AVAILABLE:
+            raise ImportError(f"SciPy is required to load the sparse matrix {sparse_file}")
+        return scipy.sparse.load_npz(sparse_file).toarray()
+    return np.load(bt_dir / f"bt_matrix_{suffix}.npy", mmap_mode=mmap_mode)
+
+
+def load_json(path):
+    """Load a JSON file, parsed with orjson when available
+    
+    Files orjson rejects (e.g. NaN values written by json.dump) are read with
+    the standard library parser.
+    """
+    if ORJSON_AVAILABLE:
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return json.loads(data)
+    
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_csv(df, path):
+    """Write a DataFrame to CSV without its index
+    
+    Uses PyArrow's C++ writer when available. It quotes every string and
+    writes whole floats without '.0', so the file reads back the same with
+    pd.read_csv. Frames PyArrow cannot convert (mixed-type object columns) or
+    write as CSV (list columns) are written with to_csv.
+    """
+    if CSV_ENGINE == 'pyarrow':
+        try:
+            pyarrow.csv.write_csv(pyarrow.Table.from_pandas(df, preserve_index=False), str(path))
+            return
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            pass
+    
+    df.to_csv(path, index=False)
+
+
+def write_table(df, path):
+    """Write a DataFrame to CSV plus a Parquet copy next to it
+    
+    The CSV stays the readable artifact; the zstd Parquet copy (same name,
+    .parquet) keeps the dtypes and is what read_table loads. Without PyArrow
+    (or for frames it cannot convert) only the CSV is written and any older
+    Parquet copy is removed.
+    """
+    path = Path(path)
+    write_csv(df, path)
+    
+    parquet_path = path.with_suffix('.parquet')
+    if CSV_ENGINE == 'pyarrow':
+        try:
+            df.to_parquet(parquet_path, index=False, compression='zstd')
+            return
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            pass
+    
+    parquet_path.unlink(missing_ok=True)
+
+
+def read_table(path):
+    """Read a table written by write_table, preferring its Parquet copy
+    
+    The copy is only used when it is at least as new as the CSV, so a CSV
+    rewritten by some other tool is never shadowed by stale Parquet data.
+    """
+    path = Path(path)
+    parquet_path = path.with_suffix('.parquet')
+    if (CSV_ENGINE == 'pyarrow' and parquet_path.exists()
+            and parquet_path.stat().st_mtime >= path.stat().st_mtime):
+        return pd.read_parquet(parquet_path)
+    
+    return pd.read_csv(path)
+
+
+def load_player_mappings(bt_dir, suffix):
+    """
+    Load player mappings written by BradleyTerryBuilder.save_results
+    
+    Returns the JSON metadata with 'player_to_idx', 'idx_to_player' and
+    'player_names' filled in from the npz archive (string keys, as in the
+    older all-JSON mapping files, which are still read as-is).
+    """
+    mappings = load_json(bt_dir / f"player_mappings_{suffix}.json")
+    
+    if 'player_to_idx' not in mappings:
+        arrays = np.load(bt_dir / f"player_mappings_{suffix}.npz")
+        player_ids = arrays['player_ids'].tolist()
+        mappings['player_to_idx'] = {str(pid): idx for idx, pid in enumerate(player_ids)}
+        mappings['idx_to_player'] = {str(idx): pid for idx, pid in enumerate(player_ids)}
+        mappings['player_names'] = dict(zip(map(str, arrays['name_ids'].tolist()), arrays['names'].tolist()))
+    
+    return mappings
+
 
 class BradleyTerryBuilder:
     def __init__(self, season_year):
@@ -21,13 +206,27 @@ class BradleyTerryBuilder:
         
         # Load data files
         self.players_df = pd.read_csv(self.data_dir / f"{season_year}_players.csv")
-        self.gameweek_df = pd.read_csv(self.data_dir / f"{season_year}_player_gameweek.csv")
+        gameweek_file = self.data_dir / f"{season_year}_player_gameweek.csv"
         
         # Create player ID to name mapping
-        if 'element' in self.gameweek_df.columns:
+        if 'element' in pd.read_csv(gameweek_file, nrows=0).columns:
             self.player_id_col = 'element'
         else:
             self.player_id_col = 'player_id'
+        
+        # Only parse the columns the builder uses
+        self.gameweek_df = pd.read_csv(
+            gameweek_file,
+            usecols=[self.player_id_col, 'total_points', 'was_home', 'GW', 'minutes',
+                     'name', 'price', 'position', 'team'],
+            dtype={
+                'name': 'category',
+                'team': 'category',
+                'position': 'category',
+                'GW': 'int16'  # At most 38 gameweeks
+            },
+            engine=CSV_ENGINE
+        )
             
         # Get unique players who actually played
         self.active_players = self.gameweek_df[self.gameweek_df['minutes'] > 0][self.player_id_col].unique()
@@ -39,7 +238,7 @@ class BradleyTerryBuilder:
         
         self.n_players = len(self.active_players)
         
-    def build_bradley_terry_matrix(self, previous_week=None, home_advantage=0.2):
+    def build_bradley_terry_matrix(self, previous_week=None, home_advantage=0.2, use_gpu=False):
         """
         Build Bradley-Terry matrix based on gameweeks 1 to previous_week
         
@@ -48,6 +247,7 @@ class BradleyTerryBuilder:
         Args:
             previous_week: Last gameweek to include (None for all)
             home_advantage: Points advantage for home players (default 0.2)
+            use_gpu: Accumulate the matrix on the GPU with CuPy
         """
         print(f"\nBuilding Bradley-Terry matrix for {self.n_players} active players...")
         print(f"Home advantage: {home_advantage} points")
@@ -61,52 +261,45 @@ class BradleyTerryBuilder:
             gw_data = self.gameweek_df[self.gameweek_df['GW'] <= previous_week]
             print(f"Using gameweeks 1-{previous_week}")
         
-        # Initialize matrix
-        bt_matrix = np.zeros((self.n_players, self.n_players), dtype=int)
-        
-        # Process each gameweek
-        unique_gws = sorted(gw_data['GW'].unique())
+        # Initialize matrix (win counts are bounded by the number of fixtures,
+        # so uint16 is plenty and keeps the accumulation memory-light)
+        if use_gpu:
+            bt_matrix = cp.zeros((self.n_players, self.n_players), dtype=cp.uint16)
+            update = _bt_update_cupy
+        else:
+            bt_matrix = np.zeros((self.n_players, self.n_players), dtype=np.uint16)
+            update = _bt_update
+        
+        # Map every row to its matrix index once; only players in the matrix are compared
+        player_idx = gw_data[self.player_id_col].map(self.player_to_idx)
+        gw_data = gw_data[player_idx.notna()]
+        
+        # Apply home advantage to every row at once
+        gw_data = pd.DataFrame({
+            'GW': gw_data['GW'].to_numpy(),
+            'player_idx': player_idx.dropna().to_numpy(dtype=np.int64),
+            'adjusted_points': (gw_data['total_points'].to_numpy(dtype=float) +
+                                np.where(gw_data['was_home'].to_numpy(dtype=bool), home_advantage, 0))
+        })
         
-        for gw in unique_gws:
+        # Process each gameweek (one grouping pass instead of a filter per gameweek)
+        for gw, gw_points in gw_data.groupby('GW', sort=True):
             print(f"  Processing GW{gw}...", end='\r')
             
-            # Get points and home/away status for this gameweek
-            gw_points = gw_data[gw_data['GW'] == gw][[self.player_id_col, 'total_points', 'was_home']]
+            # Players with two fixtures in a gameweek are compared once per
+            # fixture, using the points from their last fixture
+            by_player = gw_points.groupby('player_idx', sort=False)['adjusted_points']
+            last_fixture = by_player.last()
+            mult_arr = by_player.size().to_numpy(dtype=np.int64)
+            idx_arr = last_fixture.index.to_numpy(dtype=np.int64)
+            adj_arr = last_fixture.to_numpy()
             
-            # Only consider players who played (already filtered by minutes > 0)
-            players_this_gw = gw_points[self.player_id_col].values
-            points_this_gw = gw_points.set_index(self.player_id_col)['total_points'].to_dict()
-            home_status = gw_points.set_index(self.player_id_col)['was_home'].to_dict()
-            
-            # Compare all pairs of players who played this gameweek
-            for i, p1 in enumerate(players_this_gw):
-                if p1 not in self.player_to_idx:
-                    continue
-                    
-                idx1 = self.player_to_idx[p1]
-                p1_points = points_this_gw.get(p1, 0)
-                p1_home = home_status.get(p1, False)
-                
-                # Apply home advantage
-                p1_adjusted = p1_points + (home_advantage if p1_home else 0)
-                
-                for j, p2 in enumerate(players_this_gw):
-                    if i >= j or p2 not in self.player_to_idx:  # Avoid double counting and self-comparison
-                        continue
-                        
-                    idx2 = self.player_to_idx[p2]
-                    p2_points = points_this_gw.get(p2, 0)
-                    p2_home = home_status.get(p2, False)
-                    
-                    # Apply home advantage
-                    p2_adjusted = p2_points + (home_advantage if p2_home else 0)
-                    
-                    # Update matrix based on comparison with adjusted points
-                    if p1_adjusted > p2_adjusted:
-                        bt_matrix[idx1, idx2] += 1
-                    elif p2_adjusted > p1_adjusted:
-                        bt_matrix[idx2, idx1] += 1
-                    # If equal points (after adjustment), no update (draw)
+            # Update matrix based on comparison with adjusted points
+            # If equal points (after adjustment), no update (draw)
+            update(bt_matrix, idx_arr, adj_arr, mult_arr)
+        
+        if use_gpu:
+            bt_matrix = bt_matrix.get()
         
         print(f"\n✓ Bradley-Terry matrix built ({self.n_players}x{self.n_players})")
         
@@ -151,8 +344,8 @@ class BradleyTerryBuilder:
         """Analyze the Bradley-Terry matrix to find dominant players"""
         
         # Calculate win totals
-        wins = bt_matrix.sum(axis=1)
-        losses = bt_matrix.sum(axis=0)
+        wins = bt_matrix.sum(axis=1, dtype=np.int64)
+        losses = bt_matrix.sum(axis=0, dtype=np.int64)
         total_comparisons = wins + losses
         win_rate = np.divide(wins, total_comparisons, where=total_comparisons > 0)
         
@@ -171,8 +364,8 @@ class BradleyTerryBuilder:
         
         return summary
     
-    def save_results(self, bt_matrix, player_stats, previous_week=None, next_week=None, home_advantage=0.2):
-        """Save Bradley-Terry matrix and related data"""
+    def save_results(self, bt_matrix, player_stats, analysis, previous_week=None, next_week=None, home_advantage=0.2):
+        """Save Bradley-Terry matrix and related data (analysis from analyze_matrix)"""
         
         # Create output directory
         output_dir = self.data_dir / "bradley_terry"
@@ -184,16 +377,31 @@ class BradleyTerryBuilder:
         else:
             suffix = f"weeks_1_to_{previous_week}"
             
-        # Save matrix as numpy array
-        matrix_file = output_dir / f"bt_matrix_{suffix}.npy"
-        np.save(matrix_file, bt_matrix)
+        # Save matrix as numpy array, or as a sparse CSR matrix if mostly empty
+        # (read either with load_bt_matrix)
+        dense_file = output_dir / f"bt_matrix_{suffix}.npy"
+        sparse_file = output_dir / f"bt_matrix_{suffix}.npz"
+        density = np.count_nonzero(bt_matrix) / bt_matrix.size if bt_matrix.size else 1.0
+        if SCIPY_AVAILABLE and density < SPARSE_DENSITY:
+            matrix_file, stale_file = sparse_file, dense_file
+            scipy.sparse.save_npz(matrix_file, scipy.sparse.csr_matrix(bt_matrix))
+        else:
+            matrix_file, stale_file = dense_file, sparse_file
+            np.save(matrix_file, bt_matrix)
+        stale_file.unlink(missing_ok=True)
         print(f"\n✓ Saved Bradley-Terry matrix to {matrix_file}")
         
-        # Save player mappings (convert numpy types to Python types for JSON)
+        # Save player mappings as parallel arrays (matrix index = position in player_ids)
+        arrays_file = output_dir / f"player_mappings_{suffix}.npz"
+        np.savez_compressed(
+            arrays_file,
+            player_ids=np.asarray(self.active_players),
+            name_ids=np.array(list(self.player_names.keys())),
+            names=np.array([str(name) for name in self.player_names.values()])
+        )
+        
+        # Keep scalar metadata as JSON for human inspection (see load_player_mappings)
         mappings = {
-            'player_to_idx': {str(k): int(v) for k, v in self.player_to_idx.items()},
-            'idx_to_player': {str(k): int(v) for k, v in self.idx_to_player.items()},
-            'player_names': {str(k): str(v) for k, v in self.player_names.items()},
             'n_players': int(self.n_players),
             'previous_week': int(previous_week) if previous_week is not None else None,
             'next_week': int(next_week) if next_week is not None else None,
@@ -203,7 +411,7 @@ class BradleyTerryBuilder:
         mappings_file = output_dir / f"player_mappings_{suffix}.json"
         with open(mappings_file, 'w') as f:
             json.dump(mappings, f, indent=2)
-        print(f"✓ Saved player mappings to {mappings_file}")
+        print(f"✓ Saved player mappings to {arrays_file} and {mappings_file}")
         
         # Save player stats
         stats_file = output_dir / f"player_stats_{suffix}.csv"
@@ -211,15 +419,14 @@ class BradleyTerryBuilder:
         print(f"✓ Saved player statistics to {stats_file}")
         
         # Save matrix analysis
-        analysis = self.analyze_matrix(bt_matrix)
         analysis_file = output_dir / f"matrix_analysis_{suffix}.csv"
         analysis.to_csv(analysis_file, index=False)
         print(f"✓ Saved matrix analysis to {analysis_file}")
         
         return output_dir
     
-    def print_summary(self, bt_matrix, player_stats, previous_week=None):
-        """Print summary of results"""
+    def print_summary(self, bt_matrix, player_stats, analysis, previous_week=None):
+        """Print summary of results (analysis from analyze_matrix)"""
         
         print("\n" + "="*60)
         print("Bradley-Terry Matrix Summary")
@@ -227,11 +434,10 @@ class BradleyTerryBuilder:
         
         # Matrix info
         print(f"\nMatrix dimensions: {bt_matrix.shape}")
-        print(f"Total comparisons: {bt_matrix.sum():,}")
+        print(f"Total comparisons: {bt_matrix.sum(dtype=np.int64):,}")
         print(f"Active players: {self.n_players}")
         
         # Top performers by win rate
-        analysis = self.analyze_matrix(bt_matrix)
         print("\nTop 10 players by win rate (min 100 comparisons):")
         top_players = analysis[analysis['total_comparisons'] >= 100].head(10)
         
@@ -241,47 +447,59 @@ class BradleyTerryBuilder:
         
         # Most dominant head-to-heads
         print("\nMost dominant head-to-head records:")
-        dominant_pairs = []
+        totals = bt_matrix + bt_matrix.T
+        # max - min rather than abs(a - b) so the unsigned counts cannot wrap
+        diffs = np.maximum(bt_matrix, bt_matrix.T) - np.minimum(bt_matrix, bt_matrix.T)
         
-        for i in range(self.n_players):
-            for j in range(i+1, self.n_players):
-                diff = abs(bt_matrix[i,j] - bt_matrix[j,i])
-                total = bt_matrix[i,j] + bt_matrix[j,i]
+        # Significant difference, upper triangle only to count each pair once
+        mask = np.triu((totals >= 10) & (diffs >= 5), k=1)
+        pairs = np.argwhere(mask)
+        pair_diffs = diffs[pairs[:, 0], pairs[:, 1]]
+        
+        # Stable sort keeps row-major order among equal differences
+        order = np.argsort(-pair_diffs, kind='stable')[:5]
+        
+        dominant_pairs = []
+        for i, j in pairs[order]:
+            if bt_matrix[i,j] > bt_matrix[j,i]:
+                winner_idx, loser_idx = i, j
+            else:
+                winner_idx, loser_idx = j, i
                 
-                if total >= 10 and diff >= 5:  # Significant difference
-                    if bt_matrix[i,j] > bt_matrix[j,i]:
-                        winner_idx, loser_idx = i, j
-                    else:
-                        winner_idx, loser_idx = j, i
-                        
-                    dominant_pairs.append({
-                        'winner': self.player_names.get(self.idx_to_player[winner_idx], 'Unknown'),
-                        'loser': self.player_names.get(self.idx_to_player[loser_idx], 'Unknown'),
-                        'wins': max(bt_matrix[i,j], bt_matrix[j,i]),
-                        'losses': min(bt_matrix[i,j], bt_matrix[j,i]),
-                        'diff': diff
-                    })
-        
-        dominant_pairs.sort(key=lambda x: x['diff'], reverse=True)
-        
-        for pair in dominant_pairs[:5]:
+            dominant_pairs.append({
+                'winner': self.player_names.get(self.idx_to_player[winner_idx], 'Unknown'),
+                'loser': self.player_names.get(self.idx_to_player[loser_idx], 'Unknown'),
+                'wins': bt_matrix[winner_idx, loser_idx],
+                'losses': bt_matrix[loser_idx, winner_idx],
+                'diff': diffs[i, j]
+            })
+        
+        for pair in dominant_pairs:
             print(f"  {pair['winner']} vs {pair['loser']}: "
                   f"{pair['wins']}-{pair['losses']} "
                   f"(+{pair['diff']})")
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python src/fpl_player_prep.py [YEAR] [PREVIOUS_WEEK] [NEXT_WEEK] [HOME_ADVANTAGE]")
+    use_gpu = '--gpu' in sys.argv
+    args = [arg for arg in sys.argv if arg != '--gpu']
+    
+    if len(args) < 2:
+        print("Usage: python src/fpl_player_prep.py [YEAR] [PREVIOUS_WEEK] [NEXT_WEEK] [HOME_ADVANTAGE] [--gpu]")
         print("Example: python src/fpl_player_prep.py 2024 9 10 0.2")
         print("\nIf PREVIOUS_WEEK is not specified, uses all gameweeks")
         print("Default HOME_ADVANTAGE is 0.2 points")
+        print("--gpu builds the matrix on the GPU (requires CuPy)")
         sys.exit(1)
     
-    season_year = int(sys.argv[1])
-    previous_week = int(sys.argv[2]) if len(sys.argv) > 2 else None
-    next_week = int(sys.argv[3]) if len(sys.argv) > 3 else None
-    home_advantage = float(sys.argv[4]) if len(sys.argv) > 4 else 0.2
+    season_year = int(args[1])
+    previous_week = int(args[2]) if len(args) > 2 else None
+    next_week = int(args[3]) if len(args) > 3 else None
+    home_advantage = float(args[4]) if len(args) > 4 else 0.2
+    
+    if use_gpu and not CUPY_AVAILABLE:
+        print("Error: --gpu requires CuPy. Install it or run without --gpu.")
+        sys.exit(1)
     
     # Check if data exists
     data_dir = Path("data") / f"{season_year}"
@@ -295,16 +513,19 @@ def main():
     builder = BradleyTerryBuilder(season_year)
     
     # Build matrix with home advantage
-    bt_matrix = builder.build_bradley_terry_matrix(previous_week, home_advantage)
+    bt_matrix = builder.build_bradley_terry_matrix(previous_week, home_advantage, use_gpu)
     
     # Get player stats
     player_stats = builder.get_player_stats(previous_week, next_week)
     
+    # Analyze matrix once for both the saved CSV and the summary
+    analysis = builder.analyze_matrix(bt_matrix)
+    
     # Save results
-    output_dir = builder.save_results(bt_matrix, player_stats, previous_week, next_week, home_advantage)
+    output_dir = builder.save_results(bt_matrix, player_stats, analysis, previous_week, next_week, home_advantage)
     
     # Print summary
-    builder.print_summary(bt_matrix, player_stats, previous_week)
+    builder.print_summary(bt_matrix, player_stats, analysis, previous_week)
     
     print(f"\n✓ All results saved to: {output_dir}")
 
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+FPL Gameweek Data Store
+Loads a season's player gameweek data once, with compact dtypes, and builds the
+lookup tables shared by the team Bradley-Terry builder and the week sampler
+
+Usage:
+    store = GameweekStore(2024)
+    builder = TeamBradleyTerryBuilder(2024, store=store)
+    sampler = FPLWeekSampler(2024, store=store)
+"""
+
+from functools import cached_property
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from fpl_player_prep import CSV_ENGINE
+
+
+class GameweekStore:
+    def __init__(self, season_year):
+        self.season_year = season_year
+        self.data_dir = Path("data") / f"{season_year}"
+        
+        # Load gameweek data with compact dtypes (team names as categorical codes)
+        gameweek_df = pd.read_csv(
+            self.data_dir / f"{season_year}_player_gameweek.csv",
+            dtype={
+                'element': 'int32',
+                'GW': 'int16',
+                'total_points': 'int16',
+                'was_home': 'bool',
+                'team': 'category'
+            },
+            engine=CSV_ENGINE
+        )
+        
+        # Keep rows in gameweek order so "last" means latest (stable, so the
+        # original order within a gameweek is kept)
+        self.gameweek_df = gameweek_df.sort_values('GW', kind='stable', ignore_index=True)
+        
+        # Teams sorted by name; the code of every row indexes into unique_teams
+        team = self.gameweek_df['team']
+        self.gameweek_df['team'] = team.cat.reorder_categories(sorted(team.cat.categories))
+        self.unique_teams = list(self.gameweek_df['team'].cat.categories)
+        self.gameweek_df['team_code'] = self.gameweek_df['team'].cat.codes.astype(np.int16)
+        self.team_codes = self.gameweek_df['team_code'].to_numpy()
+        
+        self.gameweeks = range(1, self.gameweek_df['GW'].max() + 1)
+    
+    @cached_property
+    def price_by_pid_gw(self):
+        """Player x gameweek prices: last price recorded in each gameweek,
+        carried forward to gameweeks without a fixture"""
+        return self.gameweek_df.pivot_table(
+            index='element', columns='GW', values='price', aggfunc='last'
+        ).reindex(columns=self.gameweeks).ffill(axis=1)
+    
+    @cached_property
+    def team_by_pid_gw(self):
+        """Player x gameweek team: the first fixture's team if the player has one
+        that week, otherwise the team from their latest previous fixture"""
+        by_player_gw = self.gameweek_df.groupby(['element', 'GW'])['team']
+        team_first = by_player_gw.first().unstack().reindex(columns=self.gameweeks)
+        team_last = by_player_gw.last().unstack().reindex(columns=self.gameweeks).ffill(axis=1)
+        return team_first.fillna(team_last)
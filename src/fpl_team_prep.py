@@ -12,24 +12,62 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 import json
+from fpl_store import GameweekStore
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+def _build_bt_numpy(points):
+    """Count pairwise gameweek wins from a (gameweeks x teams) points matrix (NumPy fallback)"""
+    return (points[:, :, None] > points[:, None, :]).sum(axis=0, dtype=np.int16)
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _build_bt(points):
+        """Count pairwise gameweek wins from a (gameweeks x teams) points matrix
+
+        Each pair is visited once (upper triangle) and only the thread owning
+        row i writes cells [i, j] and [j, i], so no atomics are needed.
+        NaN (team did not play) never wins or loses, equal points is a draw.
+        """
+        n_gws, n_teams = points.shape
+        bt_matrix = np.zeros((n_teams, n_teams), dtype=np.int16)
+        for i in prange(n_teams):
+            for j in range(i + 1, n_teams):
+                for g in range(n_gws):
+                    if points[g, i] > points[g, j]:
+                        bt_matrix[i, j] += 1
+                    elif points[g, j] > points[g, i]:
+                        bt_matrix[j, i] += 1
+        return bt_matrix
+else:
+    _build_bt = _build_bt_numpy
 
 
 class TeamBradleyTerryBuilder:
-    def __init__(self, season_year):
+    def __init__(self, season_year, store=None):
+        """store: optional GameweekStore to share already-loaded gameweek data"""
         self.season_year = season_year
         self.data_dir = Path("data") / f"{season_year}"
         
         # Load data files
         self.teams_df = pd.read_csv(self.data_dir / f"{season_year}_teams.csv")
-        self.gameweek_df = pd.read_csv(self.data_dir / f"{season_year}_player_gameweek.csv")
+        self.store = store if store is not None else GameweekStore(season_year)
+        self.gameweek_df = self.store.gameweek_df
         self.fixtures_df = pd.read_csv(self.data_dir / f"{season_year}_fixtures.csv")
         
         # Create team mappings
         self.team_names = self.teams_df.set_index('id')['name'].to_dict()
         self.team_name_to_id = {v: k for k, v in self.team_names.items()}
         
-        # Get unique teams - use team names from gameweek data
-        self.unique_teams = sorted(self.gameweek_df['team'].unique())
+        # Get unique teams - use team names from gameweek data (sorted; the
+        # store's team_code column indexes into this list)
+        self.unique_teams = self.store.unique_teams
         self.team_to_idx = {team: idx for idx, team in enumerate(self.unique_teams)}
         self.idx_to_team = {idx: team for team, idx in self.team_to_idx.items()}
         
@@ -57,53 +95,27 @@ class TeamBradleyTerryBuilder:
             gw_data = self.gameweek_df[self.gameweek_df['GW'] <= previous_week]
             print(f"Using gameweeks 1-{previous_week}")
         
-        # Initialize matrix
-        bt_matrix = np.zeros((self.n_teams, self.n_teams), dtype=int)
+        # Total team points per gameweek as a (gameweeks x teams) matrix, built
+        # from bincounts over combined (gameweek, team) codes. Points and home
+        # appearances are counted as integers and the home advantage is added
+        # once per cell, rounded so equal totals compare equal (a draw). Teams
+        # that did not play in a gameweek stay NaN and never win or lose
+        _, gw_codes = np.unique(gw_data['GW'].to_numpy(), return_inverse=True)
+        n_cells = (gw_codes.max() + 1 if len(gw_codes) else 0) * self.n_teams
+        cells = gw_codes * self.n_teams + gw_data['team_code'].to_numpy()
         
-        # Process each gameweek
-        unique_gws = sorted(gw_data['GW'].unique())
+        total_points = np.bincount(cells, weights=gw_data['total_points'].to_numpy(), minlength=n_cells)
+        home_rows = np.bincount(cells, weights=gw_data['was_home'].to_numpy(dtype=bool), minlength=n_cells)
+        played = np.bincount(cells, minlength=n_cells) > 0
         
-        for gw in unique_gws:
-            print(f"  Processing GW{gw}...", end='\r')
-            
-            # Get all player points for this gameweek
-            gw_players = gw_data[gw_data['GW'] == gw].copy()
-            
-            # Apply home advantage to player points
-            gw_players['adjusted_points'] = gw_players.apply(
-                lambda row: row['total_points'] + (home_advantage if row['was_home'] else 0),
-                axis=1
-            )
-            
-            # Aggregate points by team
-            team_points = gw_players.groupby('team')['adjusted_points'].sum().to_dict()
-            
-            # Get teams that played this gameweek
-            teams_this_gw = list(team_points.keys())
-            
-            # Compare all pairs of teams
-            for i, team1 in enumerate(teams_this_gw):
-                if team1 not in self.team_to_idx:
-                    continue
-                    
-                idx1 = self.team_to_idx[team1]
-                team1_points = team_points.get(team1, 0)
-                
-                for j, team2 in enumerate(teams_this_gw):
-                    if i >= j or team2 not in self.team_to_idx:  # Avoid double counting and self-comparison
-                        continue
-                        
-                    idx2 = self.team_to_idx[team2]
-                    team2_points = team_points.get(team2, 0)
-                    
-                    # Update matrix based on comparison
-                    if team1_points > team2_points:
-                        bt_matrix[idx1, idx2] += 1
-                    elif team2_points > team1_points:
-                        bt_matrix[idx2, idx1] += 1
-                    # If equal points, no update (draw)
-        
-        print(f"\n✓ Bradley-Terry matrix built ({self.n_teams}x{self.n_teams})")
+        points = np.where(played, np.round(total_points + home_advantage * home_rows, 6), np.nan)
+        points = points.reshape(-1, self.n_teams)
+        
+        # Compare all pairs of teams in every gameweek (equal points is a draw);
+        # a cell counts gameweeks, so int16 is ample
+        bt_matrix = _build_bt(points)
+        
+        print(f"✓ Bradley-Terry matrix built ({self.n_teams}x{self.n_teams})")
         
         return bt_matrix
     
@@ -117,7 +129,7 @@ class TeamBradleyTerryBuilder:
             hist_data = self.gameweek_df[self.gameweek_df['GW'] <= previous_week]
         
         # Calculate team statistics
-        team_stats = hist_data.groupby('team').agg({
+        team_stats = hist_data.groupby('team', observed=True).agg({
             'total_points': ['sum', 'mean', 'std'],
             'minutes': 'sum',
             'goals_scored': 'sum',
@@ -137,13 +149,13 @@ class TeamBradleyTerryBuilder:
         team_stats['name'] = team_stats.index
         
         # Calculate additional metrics
-        team_stats['players_used'] = hist_data.groupby('team')['element'].nunique()
-        team_stats['gameweeks_played'] = hist_data.groupby('team')['GW'].nunique()
+        team_stats['players_used'] = hist_data.groupby('team', observed=True)['element'].nunique()
+        team_stats['gameweeks_played'] = hist_data.groupby('team', observed=True)['GW'].nunique()
         
         # If next_week specified, get that week's data
         if next_week is not None:
             next_gw_data = self.gameweek_df[self.gameweek_df['GW'] == next_week]
-            next_points = next_gw_data.groupby('team')['total_points'].sum()
+            next_points = next_gw_data.groupby('team', observed=True)['total_points'].sum()
             team_stats['next_week_points'] = next_points
             team_stats['next_week_points'] = team_stats['next_week_points'].fillna(0)
         
@@ -255,28 +267,31 @@ class TeamBradleyTerryBuilder:
         
         # Most dominant head-to-heads
         print("\nMost dominant head-to-head records:")
-        dominant_pairs = []
+        i_idx, j_idx = np.triu_indices(self.n_teams, k=1)
+        a = bt_matrix[i_idx, j_idx]
+        b = bt_matrix[j_idx, i_idx]
+        diff = np.abs(a - b)
+        total = a + b
+        
+        # Significant differences only, largest first (ties keep pair order)
+        keep = np.flatnonzero((total >= 5) & (diff >= 3))
+        top = keep[np.argsort(-diff[keep], kind='stable')[:5]]
         
-        for i in range(self.n_teams):
-            for j in range(i+1, self.n_teams):
-                diff = abs(bt_matrix[i,j] - bt_matrix[j,i])
-                total = bt_matrix[i,j] + bt_matrix[j,i]
-                
-                if total >= 5 and diff >= 3:  # Significant difference
-                    if bt_matrix[i,j] > bt_matrix[j,i]:
-                        winner_idx, loser_idx = i, j
-                    else:
-                        winner_idx, loser_idx = j, i
-                        
-                    dominant_pairs.append({
-                        'winner': self.idx_to_team[winner_idx],
-                        'loser': self.idx_to_team[loser_idx],
-                        'wins': max(bt_matrix[i,j], bt_matrix[j,i]),
-                        'losses': min(bt_matrix[i,j], bt_matrix[j,i]),
-                        'diff': diff
-                    })
-        
-        dominant_pairs.sort(key=lambda x: x['diff'], reverse=True)
+        dominant_pairs = []
+        for k in top:
+            i, j = i_idx[k], j_idx[k]
+            if a[k] > b[k]:
+                winner_idx, loser_idx = i, j
+            else:
+                winner_idx, loser_idx = j, i
+            
+            dominant_pairs.append({
+                'winner': self.idx_to_team[winner_idx],
+                'loser': self.idx_to_team[loser_idx],
+                'wins': max(a[k], b[k]),
+                'losses': min(a[k], b[k]),
+                'diff': diff[k]
+            })
         
         for pair in dominant_pairs[:5]:
             print(f"  {pair['winner']} vs {pair['loser']}: "
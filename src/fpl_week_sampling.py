@@ -12,33 +12,62 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 import json
+from concurrent.futures import ProcessPoolExecutor
+from fpl_player_prep import load_bt_matrix, load_player_mappings
+from fpl_store import GameweekStore
+
+
+# Per-process sampler used by _sample_one (set up by _init_sampler)
+_sampler = None
+
+
+def _init_sampler(sampler):
+    """Keep a sampler with loaded matrices in each worker"""
+    global _sampler
+    _sampler = sampler
+
+
+def _sample_one(task):
+    """Run one simulation (first, last, seed) on a private copy of the player matrix"""
+    first_observable_week, last_observable_week, seed = task
+    return _sampler._sample_weeks(
+        first_observable_week, last_observable_week,
+        _sampler.player_bt_matrix.copy(), np.random.default_rng(seed), verbose=False
+    )
 
 
 class FPLWeekSampler:
-    def __init__(self, season_year):
+    def __init__(self, season_year, store=None):
+        """store: optional GameweekStore to share already-loaded gameweek data"""
         self.season_year = season_year
         self.data_dir = Path("data") / f"{season_year}"
         
         # Load player data
         self.players_df = pd.read_csv(self.data_dir / f"{season_year}_players.csv")
-        self.gameweek_df = pd.read_csv(self.data_dir / f"{season_year}_player_gameweek.csv")
-        
-        # Create player name mapping
-        self.player_id_to_name = {}
-        for _, player in self.players_df.iterrows():
-            player_id = player['id']
-            first_name = player['first_name']
-            # Use second_name if available, otherwise use web_name
-            last_name = player['second_name'] if pd.notna(player['second_name']) and player['second_name'] != '' else player['web_name']
-            self.player_id_to_name[player_id] = {
-                'first_name': first_name,
-                'last_name': last_name,
-                'position': player['element_type']  # 1=GK, 2=DEF, 3=MID, 4=FWD
-            }
+        self.store = store if store is not None else GameweekStore(season_year)
+        self.gameweek_df = self.store.gameweek_df
         
         # Position mapping
         self.position_map = {1: 'GK', 2: 'DEF', 3: 'MID', 4: 'FWD'}
         
+        # Static player info indexed by player id
+        # Use second_name if available, otherwise use web_name
+        players = self.players_df.set_index('id')
+        has_second_name = players['second_name'].notna() & (players['second_name'] != '')
+        self._player_static = pd.DataFrame({
+            'first_name': players['first_name'],
+            'last_name': players['second_name'].where(has_second_name, players['web_name']),
+            'role': players['element_type'].map(self.position_map).fillna('UNK')  # 1=GK, 2=DEF, 3=MID, 4=FWD
+        })
+        
+        # Player x gameweek price matrix (latest price up to each gameweek)
+        price_pivot = self.store.price_by_pid_gw
+        self._price_matrix = price_pivot.to_numpy()
+        self._price_row = {player_id: i for i, player_id in enumerate(price_pivot.index)}
+        
+        # Fallback for players/weeks without gameweek data
+        self._fallback_price = (players['now_cost'] / 10).to_dict()  # Convert to millions
+        
     def load_bradley_terry_matrices(self, last_observable_week):
         """Load player and team Bradley-Terry matrices"""
         # Determine file suffix
@@ -46,12 +75,9 @@ class FPLWeekSampler:
         
         # Load player Bradley-Terry data
         player_bt_dir = self.data_dir / "bradley_terry"
-        player_matrix_file = player_bt_dir / f"bt_matrix_{suffix}.npy"
-        player_mappings_file = player_bt_dir / f"player_mappings_{suffix}.json"
         
-        self.player_bt_matrix = np.load(player_matrix_file)
-        with open(player_mappings_file, 'r') as f:
-            player_mappings = json.load(f)
+        self.player_bt_matrix = load_bt_matrix(player_bt_dir, suffix)
+        player_mappings = load_player_mappings(player_bt_dir, suffix)
         
         self.player_to_idx = {int(k): v for k, v in player_mappings['player_to_idx'].items()}
         self.idx_to_player = {v: int(k) for k, v in player_mappings['player_to_idx'].items()}
@@ -70,18 +96,18 @@ class FPLWeekSampler:
         
     def calculate_bradley_terry_scores(self, matrix):
         """Calculate Bradley-Terry scores from win matrix"""
-        n = matrix.shape[0]
+        return self._scores_from_wins(matrix.sum(axis=1, dtype=np.float64), matrix.sum(axis=0, dtype=np.float64))
+    
+    def _scores_from_wins(self, wins, losses):
+        """Calculate Bradley-Terry scores from per-row win and loss totals of a win matrix"""
+        n = len(wins)
         
-        # Add small epsilon to avoid division by zero
+        # Add small epsilon (per comparison cell) to avoid division by zero
         epsilon = 1e-6
-        total_comparisons = matrix + matrix.T + epsilon
+        total = wins + losses + n * epsilon
         
-        # Calculate win rates
-        win_rates = np.zeros(n)
-        for i in range(n):
-            wins = matrix[i, :].sum()
-            total = total_comparisons[i, :].sum()
-            win_rates[i] = wins / total if total > 0 else 0.5
+        # Calculate win rates (0.5 for rows without comparisons)
+        win_rates = np.divide(wins, total, out=np.full(n, 0.5), where=total > 0)
         
         # Convert to Bradley-Terry scores (log-odds)
         scores = np.log(win_rates + epsilon) - np.log(1 - win_rates + epsilon)
@@ -93,136 +119,178 @@ class FPLWeekSampler:
     
     def get_player_price_at_week(self, player_id, gameweek):
         """Get player price at specific gameweek"""
-        player_gw_data = self.gameweek_df[
-            (self.gameweek_df['element'] == player_id) & 
-            (self.gameweek_df['GW'] <= gameweek)
-        ]
-        
-        if len(player_gw_data) > 0:
-            # Get the most recent price
-            latest_data = player_gw_data.iloc[-1]
-            return latest_data['price']
-        else:
-            # If no data, try to get from players df
-            player_data = self.players_df[self.players_df['id'] == player_id]
-            if len(player_data) > 0:
-                return player_data.iloc[0]['now_cost'] / 10  # Convert to millions
-            return 0.0
+        row = self._price_row.get(player_id)
+        if row is not None and gameweek >= 1:
+            # Most recent price up to this gameweek
+            price = self._price_matrix[row, min(gameweek, self._price_matrix.shape[1]) - 1]
+            if not np.isnan(price):
+                return price
+        
+        # If no data, try to get from players df
+        return self._fallback_price.get(player_id, 0.0)
     
-    def simulate_future_week(self, player_bt_matrix, team_bt_matrix, previous_results):
-        """Simulate Bradley-Terry comparisons for a future week"""
+    def simulate_future_week(self, player_bt_matrix, rng=None, win_totals=None):
+        """Simulate Bradley-Terry comparisons for a future week
+        
+        Updates player_bt_matrix in place. Outcomes are drawn from rng (a numpy
+        Generator), or the global np.random state if not given.
+        win_totals: optional (wins, losses) per-player totals kept in step with
+        player_bt_matrix; they are updated in place and used for the scores
+        instead of summing the matrix again.
+        """
         # Calculate current scores
-        player_scores = self.calculate_bradley_terry_scores(player_bt_matrix)
-        team_scores = self.calculate_bradley_terry_scores(team_bt_matrix)
+        if win_totals is None:
+            player_scores = self.calculate_bradley_terry_scores(player_bt_matrix)
+        else:
+            player_scores = self._scores_from_wins(*win_totals)
         
         # For each player, simulate comparisons based on scores
         n_players = player_bt_matrix.shape[0]
         
-        for i in range(n_players):
-            for j in range(i + 1, n_players):
-                # Calculate probability of i beating j
-                score_diff = player_scores[i] - player_scores[j]
-                prob_i_wins = 1 / (1 + np.exp(-score_diff))
-                
-                # Simulate outcome
-                if np.random.random() < prob_i_wins:
-                    player_bt_matrix[i, j] += 1
-                else:
-                    player_bt_matrix[j, i] += 1
-        
-        return player_bt_matrix, team_bt_matrix
+        # Calculate probability of i beating j for every pair i < j
+        i_idx, j_idx = np.triu_indices(n_players, k=1)
+        score_diff = player_scores[i_idx] - player_scores[j_idx]
+        prob_i_wins = 1 / (1 + np.exp(-score_diff))
+        
+        # Simulate outcomes (one draw per pair, in the same row-major pair order)
+        random = np.random.random if rng is None else rng.random
+        i_wins = random(len(i_idx)) < prob_i_wins
+        
+        # Each pair appears once, so plain fancy-index increments are safe
+        player_bt_matrix[i_idx[i_wins], j_idx[i_wins]] += 1
+        player_bt_matrix[j_idx[~i_wins], i_idx[~i_wins]] += 1
+        
+        # Keep the running totals in step (every pair adds one win and one loss)
+        if win_totals is not None:
+            wins, losses = win_totals
+            wins += np.bincount(np.where(i_wins, i_idx, j_idx), minlength=n_players)
+            losses += np.bincount(np.where(i_wins, j_idx, i_idx), minlength=n_players)
     
-    def create_sampling_dataframe(self, first_observable_week, last_observable_week):
-        """Create dataframe with player scores for all weeks"""
-        results = []
+    def create_sampling_dataframe(self, first_observable_week, last_observable_week, rng=None):
+        """Create dataframe with player scores for all weeks
         
+        Future weeks are simulated with rng (a numpy Generator), or the global
+        np.random state if not given.
+        """
         # Load Bradley-Terry matrices
         self.load_bradley_terry_matrices(last_observable_week)
         
+        # Simulate on the loaded matrix in place (it is reloaded on the next call)
+        return self._sample_weeks(first_observable_week, last_observable_week, self.player_bt_matrix, rng)
+    
+    def sample_many(self, first_observable_week, last_observable_week, n_sims, n_jobs=None):
+        """Run n_sims independent simulations of the future weeks in parallel
+        
+        Simulation k uses np.random.default_rng(k). Returns all simulations
+        concatenated, with the simulation number in a 'sim' column.
+        """
+        # Load the matrices once; each worker gets its own copy of the sampler
+        self.load_bradley_terry_matrices(last_observable_week)
+        
+        tasks = [(first_observable_week, last_observable_week, seed) for seed in range(n_sims)]
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_sampler, initargs=(self,)) as ex:
+            sims = list(ex.map(_sample_one, tasks))
+        
+        return pd.concat([df.assign(sim=seed) for seed, df in enumerate(sims)], ignore_index=True)
+    
+    def _sample_weeks(self, first_observable_week, last_observable_week, player_bt_matrix, rng=None, verbose=True):
+        """Score every player for each gameweek, simulating weeks after last_observable_week
+        
+        player_bt_matrix is updated in place by the simulated weeks.
+        """
+        # Per-gameweek (rows, gameweek, price, player_score, team_score) column chunks
+        chunks = []
+        
         # Get all unique players from gameweek data
         all_players = self.gameweek_df['element'].unique()
         
         # Get maximum gameweek in data
         max_gameweek = self.gameweek_df['GW'].max()
         
+        # Player's team in each gameweek, aligned with all_players
+        team_by_gw = self.store.team_by_pid_gw.reindex(all_players).to_numpy()
+        
+        # Prices aligned with all_players (fallback where no gameweek price yet)
+        price_by_gw = self._price_matrix[[self._price_row[player_id] for player_id in all_players]]
+        fallback_price = np.array([self._fallback_price.get(player_id, 0.0) for player_id in all_players])
+        
+        # Static player info aligned with all_players
+        player_static = self._player_static.reindex(all_players)
+        has_info = np.isin(all_players, self._player_static.index)
+        first_names = player_static['first_name'].to_numpy()
+        last_names = player_static['last_name'].to_numpy()
+        roles = player_static['role'].to_numpy()
+        
+        # Matrix index per player (-1 if not in the Bradley-Terry matrix)
+        player_idx = pd.Series(self.player_to_idx).reindex(all_players, fill_value=-1).to_numpy()
+        in_player_bt = player_idx >= 0
+        
+        # Team matrix index per player and gameweek (-1 if unknown), via categorical codes
+        team_names = sorted(self.team_to_idx, key=self.team_to_idx.get)
+        team_idx_by_gw = pd.Categorical(
+            team_by_gw.ravel(), categories=team_names
+        ).codes.reshape(team_by_gw.shape)
+        has_team_by_gw = pd.notna(team_by_gw)
+        
+        # Scores from the actual Bradley-Terry matrices are the same for every
+        # observable week, so compute them once
+        # Running per-player win/loss totals let simulated weeks skip re-summing
+        # the player matrix
+        win_totals = (player_bt_matrix.sum(axis=1, dtype=np.float64),
+                      player_bt_matrix.sum(axis=0, dtype=np.float64))
+        player_scores = self._scores_from_wins(*win_totals)
+        team_scores = self.calculate_bradley_terry_scores(self.team_bt_matrix)
+        
         # Process each gameweek
         for gw in range(first_observable_week, max_gameweek + 1):
-            print(f"Processing gameweek {gw}...")
+            if verbose:
+                print(f"Processing gameweek {gw}...")
             
-            # Calculate scores for this week
-            if gw <= last_observable_week:
-                # Use actual Bradley-Terry matrices
-                player_scores = self.calculate_bradley_terry_scores(self.player_bt_matrix)
-                team_scores = self.calculate_bradley_terry_scores(self.team_bt_matrix)
-            else:
+            # Recalculate player scores only once weeks are simulated (team
+            # results are not simulated, so team scores stay as observed)
+            if gw > last_observable_week:
                 # Simulate future week
-                self.player_bt_matrix, self.team_bt_matrix = self.simulate_future_week(
-                    self.player_bt_matrix.copy(), 
-                    self.team_bt_matrix.copy(),
-                    results
-                )
-                player_scores = self.calculate_bradley_terry_scores(self.player_bt_matrix)
-                team_scores = self.calculate_bradley_terry_scores(self.team_bt_matrix)
+                self.simulate_future_week(player_bt_matrix, rng, win_totals)
+                player_scores = self._scores_from_wins(*win_totals)
+            
+            # Skip players without info or without any team up to this week
+            rows = np.flatnonzero(has_info & has_team_by_gw[:, gw - 1])
+            team_idx = team_idx_by_gw[rows, gw - 1]
+            
+            # Get scores
+            player_score = np.where(in_player_bt[rows], player_scores[player_idx[rows]], 0.0)
+            team_score = np.where(team_idx >= 0, team_scores[team_idx], 0.0)
             
-            # Get data for this gameweek
-            gw_data = self.gameweek_df[self.gameweek_df['GW'] == gw]
+            # Get price
+            price = price_by_gw[rows, gw - 1]
+            price = np.where(np.isnan(price), fallback_price[rows], price)
             
-            # Process each player
-            for player_id in all_players:
-                # Get player info
-                player_info = self.player_id_to_name.get(player_id, {})
-                if not player_info:
-                    continue
-                
-                # Get player's team for this gameweek
-                player_gw = gw_data[gw_data['element'] == player_id]
-                if len(player_gw) > 0:
-                    team = player_gw.iloc[0]['team']
-                else:
-                    # Try to find team from previous gameweeks
-                    prev_data = self.gameweek_df[
-                        (self.gameweek_df['element'] == player_id) & 
-                        (self.gameweek_df['GW'] < gw)
-                    ]
-                    if len(prev_data) > 0:
-                        team = prev_data.iloc[-1]['team']
-                    else:
-                        continue
-                
-                # Get scores
-                player_score = 0.0
-                if player_id in self.player_to_idx:
-                    player_idx = self.player_to_idx[player_id]
-                    player_score = player_scores[player_idx]
-                
-                team_score = 0.0
-                if team in self.team_to_idx:
-                    team_idx = self.team_to_idx[team]
-                    team_score = team_scores[team_idx]
-                
-                # Calculate average score (simple average of player and team scores)
-                average_score = (player_score + team_score) / 2
-                
-                # Get price
-                price = self.get_player_price_at_week(player_id, gw)
-                
-                # Get position
-                position = self.position_map.get(player_info.get('position', 0), 'UNK')
-                
-                # Add to results
-                results.append({
-                    'first_name': player_info.get('first_name', ''),
-                    'last_name': player_info.get('last_name', ''),
-                    'club': team,
-                    'gameweek': gw,
-                    'price': price,
-                    'player_score': round(player_score, 4),
-                    'team_score': round(team_score, 4),
-                    'average_score': round(average_score, 4),
-                    'role': position
-                })
-        
-        return pd.DataFrame(results)
+            chunks.append((rows, gw, price, player_score, team_score))
+        
+        if not chunks:
+            return pd.DataFrame()
+        
+        # Build the output columns once from the per-gameweek chunks
+        rows, gws, price, player_score, team_score = zip(*chunks)
+        gameweek = np.repeat(gws, [len(r) for r in rows])
+        rows = np.concatenate(rows)
+        player_score = np.concatenate(player_score)
+        team_score = np.concatenate(team_score)
+        
+        # Calculate average score (simple average of player and team scores)
+        average_score = (player_score + team_score) / 2
+        
+        return pd.DataFrame({
+            'first_name': first_names[rows],
+            'last_name': last_names[rows],
+            'club': team_by_gw[rows, gameweek - 1],
+            'gameweek': gameweek,
+            'price': np.concatenate(price),
+            'player_score': np.round(player_score, 4),
+            'team_score': np.round(team_score, 4),
+            'average_score': np.round(average_score, 4),
+            'role': roles[rows]
+        })
     
     def save_results(self, df, first_observable_week, last_observable_week):
         """Save results to CSV"""
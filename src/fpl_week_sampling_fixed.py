@@ -7,7 +7,45 @@ import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
-import json
+from fpl_player_prep import CSV_ENGINE, load_bt_matrix, load_json, load_player_mappings, write_csv
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+def _assemble_numpy(player_idx, team_idx, player_scores, team_scores):
+    """Gather player/team scores per row (0 for index -1) and their average (NumPy fallback)"""
+    player_score = np.zeros(len(player_idx))
+    known = player_idx >= 0
+    player_score[known] = player_scores[player_idx[known]]
+    
+    team_score = np.zeros(len(team_idx))
+    known = team_idx >= 0
+    team_score[known] = team_scores[team_idx[known]]
+    
+    return player_score, team_score, (player_score + team_score) * 0.5
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _assemble(player_idx, team_idx, player_scores, team_scores):
+        """Gather player/team scores per row (0 for index -1) and their average"""
+        n_rows = len(player_idx)
+        player_score = np.empty(n_rows)
+        team_score = np.empty(n_rows)
+        average_score = np.empty(n_rows)
+        for i in prange(n_rows):
+            ps = player_scores[player_idx[i]] if player_idx[i] >= 0 else 0.0
+            ts = team_scores[team_idx[i]] if team_idx[i] >= 0 else 0.0
+            player_score[i] = ps
+            team_score[i] = ts
+            average_score[i] = (ps + ts) * 0.5
+        return player_score, team_score, average_score
+else:
+    _assemble = _assemble_numpy
 
 
 class FPLWeekSamplerFixed:
@@ -16,29 +54,97 @@ class FPLWeekSamplerFixed:
         self.data_dir = Path("data") / f"{season_year}"
         
         # Load player data
-        self.players_df = pd.read_csv(self.data_dir / f"{season_year}_players.csv")
-        self.gameweek_df = pd.read_csv(self.data_dir / f"{season_year}_player_gameweek.csv")
+        self.players_df = pd.read_csv(
+            self.data_dir / f"{season_year}_players.csv",
+            usecols=['id', 'first_name', 'second_name', 'web_name', 'element_type', 'now_cost'],
+            dtype={'id': 'int32', 'element_type': 'int8'},
+            engine=CSV_ENGINE
+        )
+        self.gameweek_df = pd.read_csv(
+            self.data_dir / f"{season_year}_player_gameweek.csv",
+            usecols=['element', 'GW', 'team', 'price'],
+            dtype={'element': 'int32', 'GW': 'int16'},
+            engine=CSV_ENGINE
+        )
         
         # Load teams data for name mapping
-        self.teams_df = pd.read_csv(self.data_dir / f"{season_year}_teams.csv")
+        self.teams_df = pd.read_csv(self.data_dir / f"{season_year}_teams.csv", engine=CSV_ENGINE)
         self.team_id_to_name = dict(zip(self.teams_df['id'], self.teams_df['name']))
         
         # Create player name mapping
-        self.player_id_to_name = {}
-        for _, player in self.players_df.iterrows():
-            player_id = player['id']
-            first_name = player['first_name']
-            # Use second_name if available, otherwise use web_name
-            last_name = player['second_name'] if pd.notna(player['second_name']) and player['second_name'] != '' else player['web_name']
-            self.player_id_to_name[player_id] = {
+        # Use second_name if available, otherwise use web_name
+        second_name = self.players_df['second_name']
+        last_names = second_name.where(second_name.notna() & (second_name != ''), self.players_df['web_name'])
+        self.player_id_to_name = {
+            player_id: {
                 'first_name': first_name,
                 'last_name': last_name,
-                'position': player['element_type']  # 1=GK, 2=DEF, 3=MID, 4=FWD
+                'position': position  # 1=GK, 2=DEF, 3=MID, 4=FWD
             }
+            for player_id, first_name, last_name, position in zip(
+                self.players_df['id'], self.players_df['first_name'], last_names, self.players_df['element_type']
+            )
+        }
         
         # Position mapping
         self.position_map = {1: 'GK', 2: 'DEF', 3: 'MID', 4: 'FWD'}
         
+        # Static player info as columns indexed by player id (last row wins for
+        # repeated ids, as in player_id_to_name); role codes index _role_names
+        self._role_names = list(self.position_map.values()) + ['UNK']
+        role_code = {position: code for code, position in enumerate(self.position_map)}
+        player_static = pd.DataFrame({
+            'first_name': self.players_df['first_name'].to_numpy(dtype=object),
+            'last_name': last_names.to_numpy(dtype=object),
+            'role_code': self.players_df['element_type'].map(role_code).fillna(len(role_code)).to_numpy(dtype=np.int8)
+        }, index=self.players_df['id'].to_numpy())
+        self._player_static = player_static[~player_static.index.duplicated(keep='last')]
+        
+        # Player's starting price, used when there is no gameweek data
+        self._fallback_price = (
+            self.players_df.drop_duplicates('id').set_index('id')['now_cost'] / 10.0
+        ).to_dict()
+        
+        # Team code of every row (self._team_ids[code] is the original team value)
+        team_codes, self._team_ids = pd.factorize(self.gameweek_df['team'], use_na_sentinel=False)
+        
+        # Sort rows by (player, gameweek) once (stable, so rows within a gameweek
+        # keep their file order) and locate each (player, gameweek) run
+        element = self.gameweek_df['element'].to_numpy()
+        gw = self.gameweek_df['GW'].to_numpy()
+        order = np.lexsort((gw, element))
+        element, gw = element[order], gw[order]
+        starts = np.flatnonzero(np.r_[True, (element[1:] != element[:-1]) | (gw[1:] != gw[:-1])])
+        ends = np.r_[starts[1:], len(order)] - 1
+        player_ids, player_row = np.unique(element[starts], return_inverse=True)
+        gw_col = gw[starts] - 1
+        
+        # Latest gameweek column up to each gameweek in which the player has a
+        # fixture (-1 before their first fixture)
+        n_gameweeks = self.gameweek_df['GW'].max()
+        has_fixture = np.zeros((len(player_ids), n_gameweeks), dtype=bool)
+        has_fixture[player_row, gw_col] = True
+        latest_gw = np.maximum.accumulate(np.where(has_fixture, np.arange(n_gameweeks), -1), axis=1)
+        row_index = np.arange(len(player_ids))[:, None]
+        
+        def player_by_gw(values, missing):
+            """Player x gameweek value from the player's first fixture that week,
+            otherwise from the last fixture of their latest previous gameweek"""
+            first = np.empty(has_fixture.shape, dtype=values.dtype)
+            first[player_row, gw_col] = values[order[starts]]
+            last = np.empty_like(first)
+            last[player_row, gw_col] = values[order[ends]]
+            previous = np.where(latest_gw >= 0, last[row_index, latest_gw], missing)
+            return np.where(has_fixture, first, previous)
+        
+        # Player x gameweek team code (-1 before the player's first fixture)
+        self._team_matrix = player_by_gw(team_codes, -1).astype(np.int16)
+        
+        # Player x gameweek price (starting price before the first fixture)
+        fallback_price = np.array([self._fallback_price.get(player_id, 0.0) for player_id in player_ids])
+        self._price_matrix = player_by_gw(self.gameweek_df['price'].to_numpy(), fallback_price[:, None])
+        self._price_row = {player_id: i for i, player_id in enumerate(player_ids)}
+        
     def load_bradley_terry_matrices(self, last_observable_week):
         """Load player and team Bradley-Terry matrices"""
         # Determine file suffix
@@ -46,13 +152,13 @@ class FPLWeekSamplerFixed:
         
         # Load player Bradley-Terry data
         player_bt_dir = self.data_dir / "bradley_terry"
-        player_matrix_file = player_bt_dir / f"bt_matrix_{suffix}.npy"
         player_mappings_file = player_bt_dir / f"player_mappings_{suffix}.json"
         
-        if player_matrix_file.exists() and player_mappings_file.exists():
-            self.player_bt_matrix = np.load(player_matrix_file)
-            with open(player_mappings_file, 'r') as f:
-                player_mappings = json.load(f)
+        # The matrix is .npy, or .npz when saved sparse
+        if any(player_bt_dir.glob(f"bt_matrix_{suffix}.np[yz]")) and player_mappings_file.exists():
+            # Only reduced along its axes, so map it read-only instead of reading it in
+            self.player_bt_matrix = load_bt_matrix(player_bt_dir, suffix, mmap_mode='r')
+            player_mappings = load_player_mappings(player_bt_dir, suffix)
             self.player_to_idx = {int(k): v for k, v in player_mappings['player_to_idx'].items()}
             self.idx_to_player = {v: int(k) for k, v in player_mappings['player_to_idx'].items()}
         else:
@@ -67,10 +173,10 @@ class FPLWeekSamplerFixed:
         team_mappings_file = team_bt_dir / f"team_mappings_{suffix}.json"
         
         if team_matrix_file.exists() and team_mappings_file.exists():
-            self.team_bt_matrix = np.load(team_matrix_file)
-            with open(team_mappings_file, 'r') as f:
-                team_mappings = json.load(f)
-            self.team_to_idx = {k: v for k, v in team_mappings['team_to_idx'].items()}
+            self.team_bt_matrix = np.load(team_matrix_file, mmap_mode='r')
+            team_mappings = load_json(team_mappings_file)
+            # JSON keys are strings: restore integer team IDs so keys match gameweek_df['team']
+            self.team_to_idx = {int(k) if k.isdigit() else k: v for k, v in team_mappings['team_to_idx'].items()}
             self.idx_to_team = {v: k for k, v in team_mappings['team_to_idx'].items()}
         else:
             print(f"Warning: Team Bradley-Terry files not found for weeks 1-{last_observable_week}")
@@ -88,46 +194,26 @@ class FPLWeekSamplerFixed:
         losses = bt_matrix.sum(axis=0)
         total_games = wins + losses
         
-        # Avoid division by zero
-        win_rates = np.zeros(len(wins))
-        mask = total_games > 0
-        win_rates[mask] = wins[mask] / total_games[mask]
+        # Avoid division by zero (win rate 0 without games)
+        scores = np.divide(wins, total_games, out=np.zeros(len(wins)), where=total_games > 0)
         
-        # Convert to scores (centered around 0)
-        scores = (win_rates - 0.5) * 4  # Scale to roughly -2 to +2
+        # Convert to scores (centered around 0), reusing the win rate buffer
+        scores -= 0.5
+        scores *= 4  # Scale to roughly -2 to +2
         
         return scores
     
     def get_player_price_at_week(self, player_id, week):
         """Get player price at specific gameweek"""
-        player_week_data = self.gameweek_df[
-            (self.gameweek_df['element'] == player_id) & 
-            (self.gameweek_df['GW'] == week)
-        ]
-        
-        if len(player_week_data) > 0:
-            return player_week_data.iloc[0]['price']
-        
-        # If no data for this week, try previous weeks
-        prev_data = self.gameweek_df[
-            (self.gameweek_df['element'] == player_id) & 
-            (self.gameweek_df['GW'] < week)
-        ]
-        
-        if len(prev_data) > 0:
-            return prev_data.iloc[-1]['price']
+        row = self._price_row.get(player_id)
+        if row is not None and week >= 1:
+            return self._price_matrix[row, min(week, self._price_matrix.shape[1]) - 1]
         
         # Default to player's starting price
-        player_data = self.players_df[self.players_df['id'] == player_id]
-        if len(player_data) > 0:
-            return player_data.iloc[0]['now_cost'] / 10.0
-        
-        return 0.0
+        return self._fallback_price.get(player_id, 0.0)
     
     def create_sampling_dataframe(self, first_observable_week, last_observable_week):
         """Create dataframe with player scores for all weeks"""
-        results = []
-        
         # Load Bradley-Terry matrices
         self.load_bradley_terry_matrices(last_observable_week)
         
@@ -137,87 +223,75 @@ class FPLWeekSamplerFixed:
         # Get maximum gameweek in data
         max_gameweek = self.gameweek_df['GW'].max()
         
-        # Process each gameweek
-        for gw in range(first_observable_week, max_gameweek + 1):
-            print(f"Processing gameweek {gw}...")
-            
-            # Calculate scores for this week
-            if gw <= last_observable_week:
-                # Use actual Bradley-Terry matrices
-                player_scores = self.calculate_bradley_terry_scores(self.player_bt_matrix)
-                team_scores = self.calculate_bradley_terry_scores(self.team_bt_matrix)
-            else:
-                # For future weeks, use the last observable week's scores
-                player_scores = self.calculate_bradley_terry_scores(self.player_bt_matrix)
-                team_scores = self.calculate_bradley_terry_scores(self.team_bt_matrix)
-            
-            # Get data for this gameweek
-            gw_data = self.gameweek_df[self.gameweek_df['GW'] == gw]
-            
-            # Process each player
-            for player_id in all_players:
-                # Get player info
-                player_info = self.player_id_to_name.get(player_id, {})
-                if not player_info:
-                    continue
-                
-                # Get player's team for this gameweek
-                player_gw = gw_data[gw_data['element'] == player_id]
-                if len(player_gw) > 0:
-                    team_id = player_gw.iloc[0]['team']
-                else:
-                    # Try to find team from previous gameweeks
-                    prev_data = self.gameweek_df[
-                        (self.gameweek_df['element'] == player_id) & 
-                        (self.gameweek_df['GW'] < gw)
-                    ]
-                    if len(prev_data) > 0:
-                        team_id = prev_data.iloc[-1]['team']
-                    else:
-                        continue
-                
-                # Map team ID to team name
-                team_name = self.team_id_to_name.get(team_id, f"Unknown_{team_id}")
-                
-                # Get scores
-                player_score = 0.0
-                if player_id in self.player_to_idx:
-                    player_idx = self.player_to_idx[player_id]
-                    player_score = player_scores[player_idx]
-                
-                team_score = 0.0
-                if str(team_id) in self.team_to_idx:  # Team IDs might be strings in the mapping
-                    team_idx = self.team_to_idx[str(team_id)]
-                    team_score = team_scores[team_idx]
-                
-                # Calculate average score (simple average of player and team scores)
-                average_score = (player_score + team_score) / 2
-                
-                # Get price
-                price = self.get_player_price_at_week(player_id, gw)
-                
-                # Get position
-                position = self.position_map.get(player_info.get('position', 0), 'UNK')
-                
-                # Add to results
-                results.append({
-                    'first_name': player_info.get('first_name', ''),
-                    'last_name': player_info.get('last_name', ''),
-                    'club': team_name,  # Use team name instead of ID
-                    'gameweek': gw,
-                    'price': price,
-                    'player_score': round(player_score, 4),
-                    'team_score': round(team_score, 4),
-                    'average_score': round(average_score, 4),
-                    'role': position
-                })
-        
-        return pd.DataFrame(results)
+        # Player table rows aligned with all_players
+        player_rows = [self._price_row[player_id] for player_id in all_players]
+        
+        # Player's team code in each gameweek (-1 if none yet)
+        team_by_gw = self._team_matrix[player_rows]
+        
+        # Map team ID to team name, and to its team matrix index
+        team_names = [self.team_id_to_name.get(team_id, f"Unknown_{team_id}") for team_id in self._team_ids]
+        club_names, club_code_by_team = np.unique(np.array(team_names, dtype=object), return_inverse=True)
+        team_idx_by_code = np.array([self.team_to_idx.get(team_id, -1) for team_id in self._team_ids], dtype=np.int64)
+        
+        # Static player info aligned with all_players (players missing from
+        # players_df are skipped)
+        player_static = self._player_static.reindex(all_players)
+        has_info = player_static['role_code'].notna().to_numpy()
+        first_names = player_static['first_name'].to_numpy()
+        last_names = player_static['last_name'].to_numpy()
+        role_codes = player_static['role_code'].fillna(0).to_numpy(dtype=np.int8)
+        
+        # Price of each player in every gameweek
+        price_by_gw = self._price_matrix[player_rows]
+        
+        # Matrix index per player (-1 if not in the Bradley-Terry matrix)
+        player_idx = np.array([self.player_to_idx.get(player_id, -1) for player_id in all_players], dtype=np.int64)
+        
+        # Calculate scores once: observable weeks use the actual Bradley-Terry
+        # matrices and future weeks reuse the last observable week's scores,
+        # which are the same matrices
+        player_scores = self.calculate_bradley_terry_scores(self.player_bt_matrix)
+        team_scores = self.calculate_bradley_terry_scores(self.team_bt_matrix)
+        
+        if first_observable_week > max_gameweek:
+            return pd.DataFrame()
+        
+        # Every gameweek reuses the same scores, so select the output rows of all
+        # gameweeks at once (gameweek-major, players in all_players order),
+        # skipping players without info or without any team up to that week
+        print(f"Processing gameweeks {first_observable_week}-{max_gameweek}...")
+        in_output = has_info[:, None] & (team_by_gw[:, first_observable_week - 1:] >= 0)
+        gw_offset, rows = np.nonzero(in_output.T)
+        gameweek = gw_offset + first_observable_week
+        team_code = team_by_gw[rows, gameweek - 1]
+        
+        # Get scores (0 for players/teams missing from the matrices) and their
+        # simple average
+        player_score, team_score, average_score = _assemble(
+            player_idx[rows], team_idx_by_code[team_code], player_scores, team_scores
+        )
+        
+        # Round to 4 decimals in place
+        for score in (player_score, team_score, average_score):
+            np.round(score, 4, out=score)
+        
+        return pd.DataFrame({
+            'first_name': first_names[rows],
+            'last_name': last_names[rows],
+            'club': pd.Categorical.from_codes(club_code_by_team[team_code], club_names),  # Use team name instead of ID
+            'gameweek': gameweek,
+            'price': price_by_gw[rows, gameweek - 1],
+            'player_score': player_score,
+            'team_score': team_score,
+            'average_score': average_score,
+            'role': pd.Categorical.from_codes(role_codes[rows], self._role_names)
+        })
     
     def save_results(self, df, first_observable_week, last_observable_week):
         """Save results to CSV"""
         output_file = self.data_dir / f"pred_{self.season_year}_week_sampling_{first_observable_week}_to_{last_observable_week}_fixed.csv"
-        df.to_csv(output_file, index=False)
+        write_csv(df, output_file)
         print(f"\n✓ Saved results to {output_file}")
         return output_file
 
@@ -12,6 +12,7 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 import json
+from fpl_player_prep import CSV_ENGINE, write_csv
 
 
 class FPLWeekSamplerMerged:
@@ -19,13 +20,19 @@ class FPLWeekSamplerMerged:
         self.data_dir = Path("data")
         
         # Load player data from both seasons
-        self.players_2024 = pd.read_csv(self.data_dir / "2024" / "2024_players.csv")
-        self.players_2025 = pd.read_csv(self.data_dir / "2025" / "2025_players.csv")
-        self.gameweek_2024 = pd.read_csv(self.data_dir / "2024" / "2024_player_gameweek.csv")
+        # Only the name, team and price columns are used, with compact dtypes
+        player_columns = {
+            'usecols': ['first_name', 'web_name', 'team', 'now_cost'],
+            'dtype': {'team': 'int8'},
+            'engine': CSV_ENGINE
+        }
+        self.players_2024 = pd.read_csv(self.data_dir / "2024" / "2024_players.csv", **player_columns)
+        self.players_2025 = pd.read_csv(self.data_dir / "2025" / "2025_players.csv", **player_columns)
+        self.gameweek_2024 = pd.read_csv(self.data_dir / "2024" / "2024_player_gameweek.csv", engine=CSV_ENGINE)
         
         # Load team data
-        self.teams_2024 = pd.read_csv(self.data_dir / "2024" / "2024_teams.csv")
-        self.teams_2025 = pd.read_csv(self.data_dir / "2025" / "2025_teams.csv")
+        self.teams_2024 = pd.read_csv(self.data_dir / "2024" / "2024_teams.csv", engine=CSV_ENGINE)
+        self.teams_2025 = pd.read_csv(self.data_dir / "2025" / "2025_teams.csv", engine=CSV_ENGINE)
         
         # Create team mappings
         self.team_id_to_name_2024 = dict(zip(self.teams_2024['id'], self.teams_2024['name']))
@@ -37,7 +44,7 @@ class FPLWeekSamplerMerged:
             # Load player mapping
             mapping_file = cache_dir / "player_replacement_mapping.csv"
             if mapping_file.exists():
-                self.player_mapping = pd.read_csv(mapping_file)
+                self.player_mapping = pd.read_csv(mapping_file, engine=CSV_ENGINE)
             else:
                 self.player_mapping = None
         else:
@@ -46,105 +53,153 @@ class FPLWeekSamplerMerged:
         # Position mapping
         self.position_map = {1: 'GK', 2: 'DEF', 3: 'MID', 4: 'FWD'}
         
+        # Single-player price lookups: first matching player's (row order, price)
+        # by (season, key, name), and by (season, key, name, team_id)
+        lookup = self.build_price_lookup()
+        by_name = lookup.drop_duplicates(['season', 'key', 'name'])
+        self._price_by_name = dict(zip(
+            zip(by_name['season'], by_name['key'], by_name['name']),
+            zip(by_name['order'], by_name['lookup_price'])
+        ))
+        by_name_team = lookup.drop_duplicates(['season', 'key', 'name', 'player_team_id'])
+        self._price_by_name_team = dict(zip(
+            zip(by_name_team['season'], by_name_team['key'], by_name_team['name'], by_name_team['player_team_id']),
+            zip(by_name_team['order'], by_name_team['lookup_price'])
+        ))
+        
+        # Team name to ID per season (first team with that name)
+        self._team_name_to_id = {
+            season: dict(zip(teams['name'][::-1], teams['id'][::-1]))
+            for season, teams in ((2024, self.teams_2024), (2025, self.teams_2025))
+        }
+        
+        # Mapped 2025 players' new prices (first mapping row per player)
+        if self.player_mapping is not None:
+            mapped = self.player_mapping.drop_duplicates('new_player')
+            self._mapped_price = dict(zip(mapped['new_player'], mapped['new_price']))
+        else:
+            self._mapped_price = {}
+        
     def get_player_price_for_gameweek(self, player_name, team, gameweek):
         """Get appropriate price based on gameweek"""
+        # GW 1-38 use 2024 prices, GW 39+ use 2025 starting prices
+        season = 2024 if gameweek <= 38 else 2025
+        first_name = player_name.split(' ', 1)[0]
         
-        if gameweek <= 38:
-            # For 2024 season (GW 1-38), use 2024 prices
-            # Try to find player in 2024 data
-            first_name, last_name = player_name.split(' ', 1) if ' ' in player_name else (player_name, '')
-            
-            # Match by name and team
-            mask = (
-                (self.players_2024['first_name'] == first_name) |
-                (self.players_2024['web_name'] == player_name)
-            )
-            
-            candidates = self.players_2024[mask]
-            if len(candidates) > 0:
-                # If we have team info, use it to disambiguate
-                if team and len(candidates) > 1:
-                    # Get team ID from name
-                    team_id = None
-                    for tid, tname in self.team_id_to_name_2024.items():
-                        if tname == team:
-                            team_id = tid
-                            break
-                    if team_id:
-                        team_candidates = candidates[candidates['team'] == team_id]
-                        if len(team_candidates) > 0:
-                            candidates = team_candidates
-                
-                # Return price in millions
-                return candidates.iloc[0]['now_cost'] / 10
-                
-        else:
-            # For 2025 season (GW 39+), use 2025 starting prices
-            first_name, last_name = player_name.split(' ', 1) if ' ' in player_name else (player_name, '')
-            
-            # Check if this is a mapped player
-            if self.player_mapping is not None:
-                # Look for this player in the mapping
-                mask = (self.player_mapping['new_player'] == player_name)
-                if mask.sum() > 0:
-                    # This is a mapped player, use their new price
-                    return self.player_mapping[mask].iloc[0]['new_price']
-            
-            # Otherwise, find in 2025 players
-            mask = (
-                (self.players_2025['first_name'] == first_name) |
-                (self.players_2025['web_name'] == player_name)
-            )
-            
-            candidates = self.players_2025[mask]
-            if len(candidates) > 0:
-                # If we have team info, use it to disambiguate
-                if team and len(candidates) > 1:
-                    # Get team ID from name
-                    team_id = None
-                    for tid, tname in self.team_id_to_name_2025.items():
-                        if tname == team:
-                            team_id = tid
-                            break
-                    if team_id:
-                        team_candidates = candidates[candidates['team'] == team_id]
-                        if len(team_candidates) > 0:
-                            candidates = team_candidates
-                
-                # Return price in millions (now_cost is already in tenths)
-                return candidates.iloc[0]['now_cost'] / 10
+        # Mapped 2025 players use their new price
+        if season == 2025 and player_name in self._mapped_price:
+            return self._mapped_price[player_name]
+        
+        # Match by first name or web name, preferring the first match from the team
+        keys = [(season, 'first_name_key', first_name), (season, 'player_name', player_name)]
+        team_id = self._team_name_to_id[season].get(team) if team else None
+        if team_id:
+            matches = [self._price_by_name_team.get(key + (team_id,)) for key in keys]
+            matches = [match for match in matches if match is not None]
+            if matches:
+                return min(matches)[1]
+        
+        matches = [self._price_by_name.get(key) for key in keys]
+        matches = [match for match in matches if match is not None]
+        if matches:
+            # Price in millions
+            return min(matches)[1]
         
         # Default fallback
         return 5.0  # Default price if not found
         
+    def build_price_lookup(self):
+        """Build the player price lookup for both seasons
+        
+        Every player appears twice, keyed by first_name and by web_name, with
+        their row order in the season's players file so that the first match
+        can be picked the same way get_player_price_for_gameweek does
+        """
+        lookups = []
+        for season, players in ((2024, self.players_2024), (2025, self.players_2025)):
+            season_players = pd.DataFrame({
+                'season': season,
+                'player_team_id': players['team'],
+                'order': np.arange(len(players)),
+                'lookup_price': players['now_cost'] / 10  # Price in millions
+            })
+            for name_col, key in (('first_name', 'first_name_key'), ('web_name', 'player_name')):
+                lookups.append(season_players.assign(key=key, name=players[name_col]))
+        
+        return pd.concat(lookups, ignore_index=True)
+    
     def update_prediction_prices(self, pred_file, output_file):
         """Update prices in prediction file based on gameweek"""
         print(f"Updating prices in {pred_file}...")
         
-        df = pd.read_csv(pred_file)
+        df = pd.read_csv(pred_file, engine=CSV_ENGINE)
         
-        # Update prices for each row
-        updated_prices = []
-        for _, row in df.iterrows():
-            player_name = f"{row['first_name']} {row['last_name']}"
-            gameweek = row['gameweek']
-            team = row['club']
-            
-            # Get correct price for this gameweek
-            price = self.get_player_price_for_gameweek(player_name, team, gameweek)
-            updated_prices.append(price)
-            
-        df['price'] = updated_prices
+        # One price query per distinct (player, team, season)
+        rows = pd.DataFrame({
+            'first_name': df['first_name'],
+            'last_name': df['last_name'],
+            'team': df['club'],
+            'season': np.where(df['gameweek'] <= 38, 2024, 2025)
+        })
+        queries = rows.drop_duplicates(ignore_index=True)
+        queries['query'] = np.arange(len(queries))
+        queries['player_name'] = [
+            f"{first_name} {last_name}" for first_name, last_name in zip(queries['first_name'], queries['last_name'])
+        ]
+        queries['first_name_key'] = queries['player_name'].str.split(' ', n=1).str[0]
+        
+        # Get team ID from name (first team with that name in each season)
+        team_ids = pd.concat([
+            self.teams_2024.assign(season=2024),
+            self.teams_2025.assign(season=2025)
+        ]).drop_duplicates(['season', 'name'])
+        queries = queries.merge(
+            team_ids[['season', 'name', 'id']].rename(columns={'name': 'team', 'id': 'team_id'}),
+            on=['season', 'team'], how='left'
+        )
+        
+        # Candidates match by first name or by web name
+        lookup = self.build_price_lookup()
+        candidates = pd.concat([
+            queries.merge(
+                lookup[lookup['key'] == key].rename(columns={'name': key}),
+                on=['season', key]
+            )
+            for key in ('first_name_key', 'player_name')
+        ]).sort_values('order', kind='stable')
+        
+        # Prefer the first candidate from the player's team, otherwise the first candidate
+        same_team = candidates[candidates['player_team_id'] == candidates['team_id']]
+        price = same_team.drop_duplicates('query').set_index('query')['lookup_price'].combine_first(
+            candidates.drop_duplicates('query').set_index('query')['lookup_price']
+        )
+        queries['price'] = queries['query'].map(price)
+        
+        # For 2025 season (GW 39+), mapped players use their new price
+        if self.player_mapping is not None:
+            mapped_price = self.player_mapping.drop_duplicates('new_player').set_index('new_player')['new_price']
+            in_2025 = queries['season'] == 2025
+            queries.loc[in_2025, 'price'] = queries.loc[in_2025, 'player_name'].map(mapped_price).combine_first(
+                queries.loc[in_2025, 'price']
+            )
+        
+        # Default price if not found
+        queries['price'] = queries['price'].fillna(5.0)
+        
+        df['price'] = rows.merge(
+            queries[['first_name', 'last_name', 'team', 'season', 'price']],
+            on=['first_name', 'last_name', 'team', 'season'], how='left'
+        )['price'].to_numpy()
         
         # Save updated file
-        df.to_csv(output_file, index=False)
+        write_csv(df, output_file)
         print(f"Saved updated prediction file to {output_file}")
         
         # Show some examples of price updates
         print("\nSample price updates:")
         sample = df[df['gameweek'] == 39].head(10)
-        for _, row in sample.iterrows():
-            print(f"  {row['first_name']} {row['last_name']} ({row['club']}): £{row['price']:.1f}m")
+        for row in sample.itertuples(index=False):
+            print(f"  {row.first_name} {row.last_name} ({row.club}): £{row.price:.1f}m")
             
 
 def main():
@@ -6,149 +6,279 @@ Enhanced FPL weekly sampling with role-specific Bradley-Terry models
 import pandas as pd
 import numpy as np
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 import json
 from pathlib import Path
+from fpl_player_prep import write_csv
 
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 
-def build_bradley_terry_matrices_with_roles(player_gw_df):
-    """Build Bradley-Terry matrices for overall players, teams, and role-specific"""
+try:
+    import scipy.sparse
+    import scipy.sparse.linalg
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+ROLES = ('GK', 'DEF', 'MID', 'FWD')
+
+# Comparison matrices sparser than this are fitted from their nonzero entries
+SPARSE_DENSITY = 0.05
+
+
+def _matrix_to_comparisons(matrix, entities, default=int):
+    """Convert a dense (winner x loser) matrix to nested {winner: {loser: value}} dicts"""
+    comparisons = defaultdict(lambda: defaultdict(default))
+    winners, losers = np.nonzero(matrix)
+    for winner, loser, value in zip(entities[winners].tolist(), entities[losers].tolist(),
+                                    matrix[winners, losers].tolist()):
+        comparisons[winner][loser] = value
+    return comparisons
+
+
+def build_bradley_terry_matrices_with_roles(player_gw_df, with_abs_comparisons=True):
+    """Build Bradley-Terry matrices for overall players, teams, and role-specific
+    
+    abs_comparisons (score-difference weighted wins) is None when
+    with_abs_comparisons is False.
+    """
+    # Get player roles mapping (a player's latest row wins)
+    player_roles = dict(zip(player_gw_df['player_id'].tolist(), player_gw_df['role'].tolist()))
+    
+    # Contiguous integer codes for players and teams (team and opponent_team
+    # share codes; -1 for a missing team)
+    player_ids, player_code = np.unique(player_gw_df['player_id'].to_numpy(), return_inverse=True)
+    team_values = pd.concat([player_gw_df['team'], player_gw_df['opponent_team']], ignore_index=True)
+    team_codes, teams = pd.factorize(team_values)
+    team_code, opponent_code = team_codes[:len(player_gw_df)], team_codes[len(player_gw_df):]
+    teams = np.asarray(teams, dtype=object)
+    n_players, n_teams = len(player_ids), len(teams)
+    
+    # Role code per player (-1 for roles without a role-specific model)
+    role_code = np.array([
+        ROLES.index(player_roles[player_id]) if player_roles[player_id] in ROLES else -1
+        for player_id in player_ids.tolist()
+    ], dtype=np.int64)
+    
+    # Keep player appearances that are a valid match with both teams known
+    valid = (team_code != opponent_code) & (team_code >= 0) & (opponent_code >= 0)
+    _, gameweek_code = np.unique(player_gw_df['gameweek'].to_numpy()[valid], return_inverse=True)
+    team_code, opponent_code = team_code[valid], opponent_code[valid]
+    player_code = player_code[valid]
+    points = player_gw_df['total_points'].to_numpy(dtype=np.float64)[valid]
+    
+    # Sort the rows once by their side of a match, (gameweek, team, opponent),
+    # so each side is a contiguous block; the opposite side of a row's match is
+    # (gameweek, opponent, team) and is found by binary search
+    side = (gameweek_code.astype(np.int64) * n_teams + team_code) * n_teams + opponent_code
+    mirror = (gameweek_code.astype(np.int64) * n_teams + opponent_code) * n_teams + team_code
+    order = np.argsort(side, kind='stable')
+    sorted_side = side[order]
+    mirror_start = np.searchsorted(sorted_side, mirror, side='left')
+    mirror_count = np.searchsorted(sorted_side, mirror, side='right') - mirror_start
+    
+    # Every (A, B) pair of players on opposite sides of a match: each row A is
+    # repeated once per row of its opposite block; every match is visited from
+    # both sides, so each comparison is counted twice
+    row_a = np.repeat(np.arange(len(side)), mirror_count)
+    offset = np.arange(len(row_a)) - np.repeat(np.cumsum(mirror_count) - mirror_count, mirror_count)
+    row_b = order[np.repeat(mirror_start, mirror_count) + offset]
+    player_a, player_b = player_code[row_a], player_code[row_b]
+    diff = points[row_a] - points[row_b]
+    a_wins, b_wins = diff > 0, diff < 0
+    
+    # Winner and loser of every decided A x B pair
+    winners = np.concatenate([player_a[a_wins], player_b[b_wins]])
+    losers = np.concatenate([player_b[a_wins], player_a[b_wins]])
+    pair = winners * n_players + losers
+    
     # Overall player comparisons
-    player_comparisons = defaultdict(lambda: defaultdict(int))
+    player_matrix = np.bincount(pair, minlength=n_players * n_players).astype(np.int32).reshape(n_players, n_players)
+    player_comparisons = _matrix_to_comparisons(player_matrix, player_ids)
     
     # Absolute points comparisons (uses score differences as weights)
     # Higher score differences indicate more dominant performances
-    abs_comparisons = defaultdict(lambda: defaultdict(float))
-    
-    # Team comparisons
-    team_comparisons = defaultdict(lambda: defaultdict(int))
-    
-    # Role-specific comparisons
-    role_comparisons = {
-        'GK': defaultdict(lambda: defaultdict(int)),
-        'DEF': defaultdict(lambda: defaultdict(int)),
-        'MID': defaultdict(lambda: defaultdict(int)),
-        'FWD': defaultdict(lambda: defaultdict(int))
-    }
-    
-    # Get player roles mapping
-    player_roles = {}
-    for _, row in player_gw_df.iterrows():
-        player_id = row['player_id']
-        role = row['role']
-        player_roles[player_id] = role
-    
-    # Group by gameweek and match
-    for gw in player_gw_df['gameweek'].unique():
-        gw_data = player_gw_df[player_gw_df['gameweek'] == gw]
-        
-        # Group by match
-        matches = gw_data.groupby(['team', 'opponent_team']).groups
-        
-        for (team_a, team_b), indices in matches.items():
-            # Skip if not a valid match
-            if team_a == team_b:
-                continue
-                
-            # Get players from each team
-            team_a_players = gw_data.loc[indices]
-            team_b_players = gw_data[
-                (gw_data['team'] == team_b) & 
-                (gw_data['opponent_team'] == team_a)
-            ]
-            
-            # Overall player comparisons
-            for _, player_a in team_a_players.iterrows():
-                for _, player_b in team_b_players.iterrows():
-                    if player_a['total_points'] > player_b['total_points']:
-                        player_comparisons[player_a['player_id']][player_b['player_id']] += 1
-                        # Absolute points comparison - use score difference as weight
-                        score_diff = player_a['total_points'] - player_b['total_points']
-                        abs_comparisons[player_a['player_id']][player_b['player_id']] += score_diff
-                    elif player_b['total_points'] > player_a['total_points']:
-                        player_comparisons[player_b['player_id']][player_a['player_id']] += 1
-                        # Absolute points comparison - use score difference as weight
-                        score_diff = player_b['total_points'] - player_a['total_points']
-                        abs_comparisons[player_b['player_id']][player_a['player_id']] += score_diff
-                    
-                    # Role-specific comparisons (only if same role)
-                    role_a = player_roles.get(player_a['player_id'])
-                    role_b = player_roles.get(player_b['player_id'])
-                    
-                    if role_a and role_b and role_a == role_b:
-                        if player_a['total_points'] > player_b['total_points']:
-                            role_comparisons[role_a][player_a['player_id']][player_b['player_id']] += 1
-                        elif player_b['total_points'] > player_a['total_points']:
-                            role_comparisons[role_b][player_b['player_id']][player_a['player_id']] += 1
-            
-            # Team comparisons
-            team_a_points = team_a_players['total_points'].sum()
-            team_b_points = team_b_players['total_points'].sum()
-            
-            if team_a_points > team_b_points:
-                team_comparisons[team_a][team_b] += 1
-            elif team_b_points > team_a_points:
-                team_comparisons[team_b][team_a] += 1
+    abs_comparisons = None
+    if with_abs_comparisons:
+        weights = np.concatenate([diff[a_wins], -diff[b_wins]])
+        abs_matrix = np.bincount(pair, weights=weights, minlength=n_players * n_players).reshape(n_players, n_players)
+        abs_comparisons = _matrix_to_comparisons(abs_matrix, player_ids, float)
+    
+    # Role-specific comparisons (only if same role)
+    same_role = (role_code[winners] == role_code[losers]) & (role_code[winners] >= 0)
+    role_pair = np.bincount(pair[same_role], minlength=n_players * n_players).astype(np.int32).reshape(n_players, n_players)
+    role_comparisons = {}
+    for code, role in enumerate(ROLES):
+        in_role = role_code == code
+        role_comparisons[role] = _matrix_to_comparisons(
+            np.where(in_role[:, None] & in_role[None, :], role_pair, 0), player_ids
+        )
+    
+    # Team comparisons: points of each side of a match summed over its sorted
+    # block (missing points count as 0), against the opposite side's (0 if it
+    # has no rows); every match is again visited from both sides
+    cumulative_points = np.concatenate(([0.0], np.cumsum(np.nan_to_num(points[order]))))
+    block_start = np.flatnonzero(np.diff(sorted_side, prepend=-1))
+    block_stop = np.searchsorted(sorted_side, sorted_side[block_start], side='right')
+    first = order[block_start]
+    team_a, team_b = team_code[first], opponent_code[first]
+    points_a = cumulative_points[block_stop] - cumulative_points[block_start]
+    mirror_stop = mirror_start[first] + mirror_count[first]
+    points_b = cumulative_points[mirror_stop] - cumulative_points[mirror_start[first]]
+    team_winners = np.concatenate([team_a[points_a > points_b], team_b[points_b > points_a]])
+    team_losers = np.concatenate([team_b[points_a > points_b], team_a[points_b > points_a]])
+    team_pair = team_winners.astype(np.int64) * n_teams + team_losers
+    team_matrix = np.bincount(team_pair, minlength=n_teams * n_teams).astype(np.int32).reshape(n_teams, n_teams)
+    team_comparisons = _matrix_to_comparisons(team_matrix, teams)
     
     return player_comparisons, team_comparisons, role_comparisons, player_roles, abs_comparisons
 
 
+def _mm_denominator_numpy(indptr, indices, data, strengths, active):
+    """sum_j n_ij / (pi_i + pi_j) over the CSR nonzeros of the game counts, 0
+    for inactive rows (NumPy fallback)"""
+    rows = np.repeat(np.arange(len(strengths)), np.diff(indptr))
+    denominator = np.bincount(rows, weights=data / (strengths[rows] + strengths[indices]),
+                              minlength=len(strengths))
+    denominator[~active] = 0.0
+    return denominator
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _mm_denominator(indptr, indices, data, strengths, active):
+        """sum_j n_ij / (pi_i + pi_j) over the CSR nonzeros of the game counts,
+        0 for inactive rows
+        
+        Each row is summed by one thread, so no atomics are needed.
+        """
+        n = len(strengths)
+        denominator = np.empty(n)
+        for i in prange(n):
+            total = 0.0
+            if not active[i]:
+                denominator[i] = total
+                continue
+            for k in range(indptr[i], indptr[i + 1]):
+                total += data[k] / (strengths[i] + strengths[indices[k]])
+            denominator[i] = total
+        return denominator
+else:
+    _mm_denominator = _mm_denominator_numpy
+
+
 def sigmoid(x, temperature=1.0):
     """Sigmoid function with temperature control"""
     return 1 / (1 + np.exp(-x * temperature))
 
 
+def _comparison_matrix(comparisons, entities):
+    """Dense (winner x loser) matrix of a nested {winner: {loser: count}} dict,
+    restricted to entities
+    
+    The matrix is float32 when every count is exactly representable in it (e.g.
+    whole-number counts below 2**24), which halves the memory read per fitting
+    sweep without changing any value; otherwise it stays float64.
+    """
+    entity_to_idx = {entity: i for i, entity in enumerate(entities)}
+    matrix = np.zeros((len(entities), len(entities)))
+    for winner, losses in comparisons.items():
+        if winner not in entity_to_idx:
+            continue
+        for loser, count in losses.items():
+            if loser in entity_to_idx:
+                matrix[entity_to_idx[winner], entity_to_idx[loser]] = count
+    compact = matrix.astype(np.float32)
+    return compact if np.array_equal(compact, matrix) else matrix
+
+
 def compute_hessian(comparisons, params, entities):
     """Compute Hessian matrix for Bradley-Terry model"""
-    n = len(entities)
-    entity_to_idx = {entity: i for i, entity in enumerate(entities)}
-    hessian = np.zeros((n, n))
-    
-    # Compute second derivatives
-    for i, entity_i in enumerate(entities):
-        for j, entity_j in enumerate(entities):
-            if i == j:
-                # Diagonal elements
-                diag_sum = 0
-                
-                # Contributions from wins
-                if entity_i in comparisons:
-                    for opponent, count in comparisons[entity_i].items():
-                        if opponent in entity_to_idx:
-                            pi = np.exp(params[entity_i])
-                            pj = np.exp(params[opponent])
-                            diag_sum += count * pi * pj / ((pi + pj) ** 2)
-                
-                # Contributions from losses
-                for opponent in entities:
-                    if opponent != entity_i and opponent in comparisons:
-                        if entity_i in comparisons[opponent]:
-                            count = comparisons[opponent][entity_i]
-                            pi = np.exp(params[entity_i])
-                            pj = np.exp(params[opponent])
-                            diag_sum += count * pi * pj / ((pi + pj) ** 2)
-                
-                hessian[i, i] = -diag_sum
-            else:
-                # Off-diagonal elements
-                if entity_i in comparisons and entity_j in comparisons[entity_i]:
-                    count = comparisons[entity_i][entity_j]
-                elif entity_j in comparisons and entity_i in comparisons[entity_j]:
-                    count = comparisons[entity_j][entity_i]
-                else:
-                    count = 0
-                
-                if count > 0:
-                    pi = np.exp(params[entity_i])
-                    pj = np.exp(params[entity_j])
-                    hessian[i, j] = count * pi * pj / ((pi + pj) ** 2)
+    wins = _comparison_matrix(comparisons, entities)
+    strengths = np.exp(np.array([params[entity] for entity in entities]))
+    return _hessian(wins, strengths)
+
+
+def _hessian(wins, strengths):
+    """Bradley-Terry Hessian from a dense (winner x loser) matrix and strengths exp(params)"""
+    # pi * pj / (pi + pj)^2 for every pair
+    pair_weight = np.outer(strengths, strengths) / (strengths[:, None] + strengths[None, :]) ** 2
+    
+    # Off-diagonal elements: count of i's wins over j, otherwise of j's wins over i
+    count = np.where(wins > 0, wins, wins.T)
+    hessian = np.where(count > 0, count * pair_weight, 0.0)
+    
+    # Diagonal elements: contributions from wins and from losses (to other entities)
+    losses = wins.T.copy()
+    np.fill_diagonal(losses, 0)
+    np.fill_diagonal(hessian, -((wins + losses) * pair_weight).sum(axis=1))
     
     return hessian
 
 
-def fit_bradley_terry_model_with_uncertainty(comparisons, max_iter=100, tol=1e-6, temperature=2.0):
-    """Fit Bradley-Terry model with uncertainty estimation"""
+def _sparse_hessian(wins, strengths, rows, cols):
+    """Bradley-Terry Hessian as a scipy CSC matrix, with entries only at the
+    (rows, cols) nonzeros of the game counts"""
+    n = len(strengths)
+    pair_weight = strengths[rows] * strengths[cols] / (strengths[rows] + strengths[cols]) ** 2
+    off_diagonal = rows != cols
+    
+    # Off-diagonal elements: count of i's wins over j, otherwise of j's wins over i
+    count = np.where(wins[rows, cols] > 0, wins[rows, cols], wins[cols, rows])
+    
+    # Diagonal elements: contributions from wins and from losses (to other entities)
+    games = wins[rows, cols] + np.where(off_diagonal, wins[cols, rows], 0)
+    diagonal = -np.bincount(rows, weights=games * pair_weight, minlength=n)
+    
+    return scipy.sparse.csc_matrix(
+        (np.concatenate([(count * pair_weight)[off_diagonal], diagonal]),
+         (np.concatenate([rows[off_diagonal], np.arange(n)]),
+          np.concatenate([cols[off_diagonal], np.arange(n)]))),
+        shape=(n, n)
+    )
+
+
+def _sparse_inverse_diagonal(matrix, block_size=256):
+    """Diagonal of the inverse of a sparse matrix from one LU factorization,
+    solving for block_size identity columns at a time"""
+    n = matrix.shape[0]
+    lu = scipy.sparse.linalg.splu(matrix)
+    diagonal = np.empty(n)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        identity = np.zeros((n, stop - start))
+        identity[np.arange(start, stop), np.arange(stop - start)] = 1
+        diagonal[start:stop] = lu.solve(identity)[np.arange(start, stop), np.arange(stop - start)]
+    return diagonal
+
+
+def fit_bradley_terry_model_with_uncertainty(comparisons, max_iter=100, tol=1e-6, temperature=2.0, init=None):
+    """Fit Bradley-Terry model with uncertainty estimation
+    
+    init optionally maps entities to the raw strengths of an earlier fit (see
+    _fit_bradley_terry_model) to start the iterations from.
+    """
+    final_strengths, uncertainties, _ = _fit_bradley_terry_model(comparisons, max_iter, tol, temperature, init)
+    return final_strengths, uncertainties
+
+
+def _fit_bradley_terry_model(comparisons, max_iter=100, tol=1e-6, temperature=2.0, init=None):
+    """Fit Bradley-Terry model with uncertainty estimation, also returning the
+    raw (pre-transformation) strength of every entity"""
     if not comparisons:
-        return {}, {}
+        return {}, {}, {}
     
     # Get all entities
     entities = set()
@@ -160,67 +290,92 @@ def fit_bradley_terry_model_with_uncertainty(comparisons, max_iter=100, tol=1e-6
     n = len(entities)
     
     if n == 0:
-        return {}, {}
+        return {}, {}, {}
+    
+    # Dense (winner x loser) counts; losses exclude self-comparisons. Strengths
+    # and everything computed from them stay float64 (the counts are upcast
+    # exactly), so the tolerance and the Hessian inverse keep full precision
+    wins = _comparison_matrix(comparisons, entities)
+    losses = wins.T.copy()
+    np.fill_diagonal(losses, 0)
+    games = wins + losses
+    total_wins = wins.sum(axis=1, dtype=np.float64)
+    
+    # Sparse game counts are kept as CSR (row-major nonzeros) so a sweep only
+    # visits the pairs that actually met
+    sparse = np.count_nonzero(games) < SPARSE_DENSITY * n * n
+    if sparse:
+        rows, indices = np.nonzero(games)
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=n))))
+        data = games[rows, indices]
+    
+    # Initialize strengths, pi = exp(param) with log-scale parameters at 0 (or
+    # warm-started from init); the strengths are the live state so no exp is
+    # needed per sweep
+    if init:
+        strengths = np.array([init.get(entity, 1.0) for entity in entities], dtype=np.float64)
+    else:
+        strengths = np.ones(n)
     
-    # Initialize parameters (log scale)
-    params = {entity: 0.0 for entity in entities}
+    # Entities updated in the next sweep: those still changing by more than
+    # tol / 10, and every opponent of one that changed by more than tol
+    active = np.ones(n, dtype=bool)
     
     # Fit model (same as before)
     for iteration in range(max_iter):
-        old_params = params.copy()
+        old_strengths = strengths.copy()
         
-        # Update each parameter
-        for i, entity_i in enumerate(entities):
-            numerator = 0
-            denominator = 0
-            
-            # Wins by entity_i
-            if entity_i in comparisons:
-                for entity_j, count in comparisons[entity_i].items():
-                    numerator += count
-                    denominator += count / (np.exp(params[entity_i]) + np.exp(params[entity_j]))
-            
-            # Losses to entity_i
-            for entity_j in entities:
-                if entity_j != entity_i and entity_j in comparisons:
-                    if entity_i in comparisons[entity_j]:
-                        count = comparisons[entity_j][entity_i]
-                        denominator += count / (np.exp(params[entity_j]) + np.exp(params[entity_i]))
-            
-            # Update parameter
-            if denominator > 0:
-                params[entity_i] = np.log(numerator / denominator) if numerator > 0 else -10
+        # Update all active parameters at once: pi_i = W_i / sum_j n_ij / (pi_i + pi_j)
+        if sparse:
+            denominator = _mm_denominator(indptr, indices, data, strengths, active)
+        else:
+            denominator = np.zeros(n)
+            denominator[active] = (games[active] / (strengths[active, None] + strengths[None, :])).sum(axis=1)
         
-        # Check convergence
-        max_change = max(abs(params[e] - old_params[e]) for e in entities)
+        # Update parameter (entities without wins get exp(-10); without games,
+        # or inactive, keep theirs)
+        has_games = denominator > 0
+        has_wins = has_games & (total_wins > 0)
+        strengths[has_wins] = total_wins[has_wins] / denominator[has_wins]
+        strengths[has_games & ~has_wins] = np.exp(-10)
+        
+        # Check convergence (change of the log-scale parameters)
+        change = np.abs(np.log(strengths / old_strengths))
+        max_change = np.max(change)
         if max_change < tol:
             break
-    
-    # Compute uncertainties using Hessian
-    hessian = compute_hessian(comparisons, params, entities)
-    
-    # Compute variance-covariance matrix
-    uncertainties = {}
+        
+        moved = change > tol
+        active = change > tol / 10
+        if sparse:
+            active[rows[moved[indices]]] = True
+        else:
+            active |= (games[:, moved] > 0).any(axis=1)
+    
+    # Compute variance-covariance matrix from the Hessian; only its diagonal is
+    # used, so sparse Hessians are factorized once instead of inverted densely
     try:
         # Add small regularization to ensure positive definite
-        regularization = 1e-6 * np.eye(n)
-        cov_matrix = np.linalg.inv(-hessian + regularization)
-        variances = np.diag(cov_matrix)
+        if sparse and SCIPY_AVAILABLE:
+            hessian = _sparse_hessian(wins, strengths, rows, indices)
+            regularization = 1e-6 * scipy.sparse.identity(n, format='csc')
+            variances = _sparse_inverse_diagonal((-hessian + regularization).tocsc())
+        else:
+            hessian = _hessian(wins, strengths)
+            regularization = 1e-6 * np.eye(n)
+            cov_matrix = np.linalg.inv(-hessian + regularization)
+            variances = np.diag(cov_matrix)
         
-        # Map back to entities
-        for i, entity in enumerate(entities):
-            uncertainties[entity] = np.sqrt(max(variances[i], 1e-10))
-    except np.linalg.LinAlgError:
+        uncertainty_values = np.sqrt(np.maximum(variances, 1e-10))
+    except (np.linalg.LinAlgError, RuntimeError):
         # If inversion fails, use default uncertainty
-        for entity in entities:
-            uncertainties[entity] = 1.0
+        uncertainty_values = np.ones(n)
     
-    # Convert to ratings
-    ratings = {entity: np.exp(param) for entity, param in params.items()}
+    # Map back to entities
+    uncertainties = dict(zip(entities, uncertainty_values))
     
-    # Apply sigmoid transformation with uncertainty weighting
-    rating_values = np.array([ratings[e] for e in entities])
-    uncertainty_values = np.array([uncertainties[e] for e in entities])
+    # Apply sigmoid transformation with uncertainty weighting (ratings are the strengths)
+    rating_values = strengths
     
     # Normalize ratings
     if len(rating_values) > 1 and np.std(rating_values) > 0:
@@ -235,51 +390,134 @@ def fit_bradley_terry_model_with_uncertainty(comparisons, max_iter=100, tol=1e-6
     weights = 1 / (1 + uncertainty_values)
     final_ratings = weights * stretched + (1 - weights) * 0.5
     
-    # Map back to dictionary
-    final_strengths = {entity: final_ratings[i] for i, entity in enumerate(entities)}
-    
-    # Normalize to sum to 1
-    total = sum(final_strengths.values())
+    # Normalize to sum to 1 (summed in entity order, as a running Python sum)
+    total = sum(final_ratings.tolist())
     if total > 0:
-        final_strengths = {e: s/total for e, s in final_strengths.items()}
+        final_ratings = final_ratings / total
     
-    return final_strengths, uncertainties
+    # Map back to dictionary
+    final_strengths = dict(zip(entities, final_ratings))
+    
+    return final_strengths, uncertainties, dict(zip(entities, strengths.tolist()))
 
 
-def fit_bradley_terry_model(comparisons, max_iter=100, tol=1e-6):
+def fit_bradley_terry_model(comparisons, max_iter=100, tol=1e-6, init=None):
     """Backward compatible wrapper"""
-    strengths, _ = fit_bradley_terry_model_with_uncertainty(comparisons, max_iter, tol)
+    strengths, _ = fit_bradley_terry_model_with_uncertainty(comparisons, max_iter, tol, init=init)
     return strengths
 
 
-def calculate_enhanced_predictions(player_gw_df, week_limit, cache_dir=None):
-    """Calculate predictions with role-specific Bradley-Terry scores"""
+def _fit_task(task):
+    """Fit one model from a (comparisons, init) pair in a worker process,
+    returning its strengths and raw strengths"""
+    comparisons, init = task
+    strengths, _, raw_strengths = _fit_bradley_terry_model(comparisons, init=init)
+    return strengths, raw_strengths
+
+
+# Raw strengths of the latest fit of each model in this process, used to
+# warm-start the next fit of the same model (e.g. the next week_limit)
+_last_raw_strengths = {}
+
+
+def _input_key(train_df):
+    """Short hash of the columns the Bradley-Terry fits depend on"""
+    columns = ['gameweek', 'player_id', 'team', 'opponent_team', 'total_points', 'role']
+    row_hashes = pd.util.hash_pandas_object(train_df[columns], index=False).to_numpy()
+    return hashlib.blake2b(row_hashes.tobytes(), digest_size=8).hexdigest()
+
+
+def _save_fits(path, fits):
+    """Save named {entity: value} dicts as parallel key/value arrays in an NPZ file
+    
+    Keys are saved as object arrays: team keys can mix names and ids, which a
+    plain np.array would turn into strings.
+    """
+    arrays = {'names': np.array(list(fits))}
+    for i, values in enumerate(fits.values()):
+        arrays[f'keys_{i}'] = np.fromiter(values.keys(), dtype=object, count=len(values))
+        arrays[f'values_{i}'] = np.array(list(values.values()))
+    np.savez_compressed(path, **arrays)
+
+
+def _load_fits(path):
+    """Load the dicts written by _save_fits, keeping their key order"""
+    # The object key arrays are pickled
+    with np.load(path, allow_pickle=True) as data:
+        return {
+            name: dict(zip(data[f'keys_{i}'].tolist(), data[f'values_{i}'].tolist()))
+            for i, name in enumerate(data['names'].tolist())
+        }
+
+
+def calculate_enhanced_predictions(player_gw_df, week_limit, cache_dir=None, n_jobs=None, warm_start=False):
+    """Calculate predictions with role-specific Bradley-Terry scores
     
-    # Filter data
-    train_df = player_gw_df[player_gw_df['gameweek'] <= week_limit].copy()
+    The overall player, team and role models are independent and are fitted in
+    parallel on up to n_jobs processes (default: one per CPU). With a cache_dir,
+    the fits are also saved to an NPZ file keyed by a hash of the input rows and
+    reused when the same data is seen again.
     
-    print(f"Building Bradley-Terry matrices for weeks 1-{week_limit}...")
-    player_comparisons, team_comparisons, role_comparisons, player_roles = \
-        build_bradley_terry_matrices_with_roles(train_df)
+    With warm_start, each model starts from this process's previous fit of the
+    same model (e.g. when stepping through week limits). Fits that stop at
+    max_iter rather than converging (unbeaten players' strengths keep growing)
+    then depend on the starting point, so this is off by default.
+    """
     
-    print("Fitting Bradley-Terry models...")
+    # Filter data
+    train_df = player_gw_df[player_gw_df['gameweek'] <= week_limit].copy()
     
-    # Fit overall models
-    player_strengths = fit_bradley_terry_model(player_comparisons)
-    team_strengths = fit_bradley_terry_model(team_comparisons)
+    fits_file = None
+    if cache_dir:
+        # '_v2': earlier files saved mixed team keys as strings
+        fits_file = Path(cache_dir) / f'bradley_terry_fits_v2_week_{week_limit}_{_input_key(train_df)}.npz'
+    
+    # Team, opponent_team and role as categoricals so matching and grouping work
+    # on integer codes; the teams share categories, in sorted order so groups
+    # come out in the same order as for the plain values
+    teams = pd.Index(train_df['team'].dropna().unique()).sort_values()
+    teams = teams.append(pd.Index(train_df['opponent_team'].dropna().unique()).difference(teams, sort=False))
+    for column in ('team', 'opponent_team'):
+        train_df[column] = pd.Categorical(train_df[column], categories=teams)
+    train_df['role'] = train_df['role'].astype('category')
+    
+    if fits_file is not None and fits_file.exists():
+        print(f"Loading cached Bradley-Terry models from {fits_file}...")
+        strengths = _load_fits(fits_file)
+        player_roles = strengths.pop('player_roles')
+    else:
+        print(f"Building Bradley-Terry matrices for weeks 1-{week_limit}...")
+        player_comparisons, team_comparisons, role_comparisons, player_roles, _ = \
+            build_bradley_terry_matrices_with_roles(train_df, with_abs_comparisons=False)
+        
+        print("Fitting Bradley-Terry models...")
+        
+        # Fit the overall and role-specific models in parallel; the nested
+        # defaultdicts are converted to plain dicts so they can be pickled
+        models = {'player': player_comparisons, 'team': team_comparisons, **role_comparisons}
+        for role in role_comparisons:
+            print(f"  Fitting {role} model...")
+        tasks = [({winner: dict(losers) for winner, losers in comparisons.items()},
+                  _last_raw_strengths.get(name) if warm_start else None)
+                 for name, comparisons in models.items()]
+        with ProcessPoolExecutor(max_workers=n_jobs) as ex:
+            fits = dict(zip(models, ex.map(_fit_task, tasks)))
+        strengths = {name: fitted for name, (fitted, _) in fits.items()}
+        _last_raw_strengths.update({name: raw for name, (_, raw) in fits.items()})
+        
+        if fits_file is not None:
+            fits_file.parent.mkdir(parents=True, exist_ok=True)
+            _save_fits(fits_file, {**strengths, 'player_roles': player_roles})
     
-    # Fit role-specific models
-    role_strengths = {}
-    for role, comparisons in role_comparisons.items():
-        print(f"  Fitting {role} model...")
-        role_strengths[role] = fit_bradley_terry_model(comparisons)
+    player_strengths = strengths.pop('player')
+    team_strengths = strengths.pop('team')
+    role_strengths = strengths
     
     # Calculate predictions
-    predictions = []
     
     # Group by player to get summary stats
     player_stats = train_df.groupby(['player_id', 'first_name', 'last_name', 
-                                     'team', 'role']).agg({
+                                     'team', 'role'], observed=True).agg({
         'total_points': ['sum', 'mean', 'count'],
         'now_cost': 'last'
     }).reset_index()
@@ -287,55 +525,58 @@ def calculate_enhanced_predictions(player_gw_df, week_limit, cache_dir=None):
     player_stats.columns = ['player_id', 'first_name', 'last_name', 'team', 
                            'role', 'total_points', 'avg_points', 'games', 'price']
     
-    for _, player in player_stats.iterrows():
-        player_id = player['player_id']
-        team = player['team']
-        role = player['role']
-        
-        # Get scores - scale based on actual performance
-        base_score = player['avg_points']  # Use historical average as base
-        
-        # Adjust by Bradley-Terry strength (multiplicative factor)
-        player_strength = player_strengths.get(player_id, 0.001)
-        team_strength = team_strengths.get(team, 0.001)
-        
-        # Scale strengths to meaningful range (0.5 to 2.0 multiplier)
-        player_multiplier = 0.5 + 1.5 * (player_strength / max(player_strengths.values())) if player_strengths else 1.0
-        team_multiplier = 0.5 + 1.5 * (team_strength / max(team_strengths.values())) if team_strengths else 1.0
-        
-        # Calculate scores
-        player_score = base_score * player_multiplier
-        team_score = base_score * team_multiplier
-        
-        # Get role-specific score
-        role_score = base_score
-        if role in role_strengths and player_id in role_strengths[role]:
-            role_strength = role_strengths[role][player_id]
-            max_role_strength = max(role_strengths[role].values()) if role_strengths[role] else 1.0
-            role_multiplier = 0.5 + 1.5 * (role_strength / max_role_strength)
-            role_score = base_score * role_multiplier
-        
-        # Calculate weighted average: 1/3(player_score + 0.5*team_score + role_score)
-        weighted_score = (player_score + 0.5 * team_score + role_score) / 3
-        
-        predictions.append({
-            'player_id': player_id,
-            'first_name': player['first_name'],
-            'last_name': player['last_name'],
-            'team': team,
-            'role': role,
-            'gameweek': week_limit + 1,
-            'price': player['price'] / 10,  # Convert to millions
-            'player_score': player_score,
-            'team_score': team_score,
-            'role_score': role_score,
-            'weighted_score': weighted_score,
-            'games_played': player['games'],
-            'total_points': player['total_points'],
-            'avg_points_historical': player['avg_points']
-        })
-    
-    pred_df = pd.DataFrame(predictions)
+    # Back to the input dtypes (mapping a categorical gives a categorical)
+    player_stats = player_stats.astype({column: player_gw_df[column].dtype for column in ('team', 'role')})
+    
+    # Get scores - scale based on actual performance
+    base_score = player_stats['avg_points']  # Use historical average as base
+    
+    # Scale Bradley-Terry strengths to a meaningful range (0.5 to 2.0 multiplier)
+    if player_strengths:
+        player_strength = player_stats['player_id'].map(player_strengths).fillna(0.001)
+        player_multiplier = 0.5 + 1.5 * (player_strength / max(player_strengths.values()))
+    else:
+        player_multiplier = 1.0
+    if team_strengths:
+        team_strength = player_stats['team'].map(team_strengths).fillna(0.001)
+        team_multiplier = 0.5 + 1.5 * (team_strength / max(team_strengths.values()))
+    else:
+        team_multiplier = 1.0
+    
+    # Role-specific strength relative to the role's strongest player; players
+    # without a role-specific strength keep their base score
+    relative_role_strength = pd.Series(np.nan, index=player_stats.index)
+    for role, strengths in role_strengths.items():
+        if strengths:
+            in_role = player_stats['role'] == role
+            relative_role_strength[in_role] = \
+                player_stats.loc[in_role, 'player_id'].map(strengths) / max(strengths.values())
+    role_multiplier = (0.5 + 1.5 * relative_role_strength).fillna(1.0)
+    
+    # Calculate scores
+    player_score = base_score * player_multiplier
+    team_score = base_score * team_multiplier
+    role_score = base_score * role_multiplier
+    
+    # Calculate weighted average: 1/3(player_score + 0.5*team_score + role_score)
+    weighted_score = (player_score + 0.5 * team_score + role_score) / 3
+    
+    pred_df = pd.DataFrame({
+        'player_id': player_stats['player_id'],
+        'first_name': player_stats['first_name'],
+        'last_name': player_stats['last_name'],
+        'team': player_stats['team'],
+        'role': player_stats['role'],
+        'gameweek': week_limit + 1,
+        'price': player_stats['price'] / 10,  # Convert to millions
+        'player_score': player_score,
+        'team_score': team_score,
+        'role_score': role_score,
+        'weighted_score': weighted_score,
+        'games_played': player_stats['games'],
+        'total_points': player_stats['total_points'],
+        'avg_points_historical': player_stats['avg_points']
+    })
     
     # Save models if cache_dir provided
     if cache_dir:
@@ -351,8 +592,16 @@ def calculate_enhanced_predictions(player_gw_df, week_limit, cache_dir=None):
             'week_limit': week_limit
         }
         
-        with open(cache_path / f'bradley_terry_models_week_{week_limit}.json', 'w') as f:
-            json.dump(bt_data, f, indent=2)
+        # orjson serializes the numpy strengths natively (integer ids are
+        # written as string keys, as json.dump does)
+        json_file = cache_path / f'bradley_terry_models_week_{week_limit}.json'
+        if ORJSON_AVAILABLE:
+            json_file.write_bytes(orjson.dumps(
+                bt_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            ))
+        else:
+            with open(json_file, 'w') as f:
+                json.dump(bt_data, f, indent=2)
         
         print(f"Saved Bradley-Terry models to {cache_path}")
     
@@ -386,7 +635,7 @@ def main():
     pred_df = calculate_enhanced_predictions(player_gw_df, week_limit, cache_dir)
     
     # Save results
-    pred_df.to_csv(output_file, index=False)
+    write_csv(pred_df, output_file)
     print(f"\nSaved predictions to {output_file}")
     print(f"Total players: {len(pred_df)}")
     print(f"\nRole distribution:")
@@ -395,9 +644,9 @@ def main():
     # Show top players by weighted score
     print("\nTop 10 players by weighted score:")
     top_players = pred_df.nlargest(10, 'weighted_score')
-    for _, p in top_players.iterrows():
-        print(f"  {p['first_name']} {p['last_name']} ({p['team']}, {p['role']}): "
-              f"£{p['price']:.1f}m, Score: {p['weighted_score']:.2f}")
+    for p in top_players.itertuples(index=False):
+        print(f"  {p.first_name} {p.last_name} ({p.team}, {p.role}): "
+              f"£{p.price:.1f}m, Score: {p.weighted_score:.2f}")
 
 
 if __name__ == "__main__":
@@ -3,10 +3,40 @@
 Generate final teams in proper FPL format with 15 players (2 GK, 5 DEF, 5 MID, 3 FWD)
 """
 
+import sys
 import pandas as pd
 import json
+import re
 from pathlib import Path
 
+from fpl_player_prep import write_csv
+
+# Player slot keys: starting XI ('GK1' .. 'FWD11') and bench ('BENCH1' .. 'BENCH4')
+PLAYER_KEY = re.compile(r'(GK|DEF|MID|FWD|BENCH)([1-9][0-9]*)')
+
+# Output columns and their dtypes, declared up front so pandas neither collects
+# the keys of every row nor infers a type per column
+SCHEMA = {
+    'rank': 'int64',
+    'captain': 'string',
+    'formation': 'string',
+    'budget': 'float64',
+    'gw1_score': 'float64',
+    '5gw_estimated': 'float64'
+}
+for pos, count in (('GK', 2), ('DEF', 5), ('MID', 5), ('FWD', 3)):
+    for j in range(1, count + 1):
+        SCHEMA.update({f'{pos}{j}': 'string', f'{pos}{j}_price': 'float64', f'{pos}{j}_score': 'float64'})
+for j in range(1, 5):
+    SCHEMA.update({f'BENCH{j}': 'string', f'BENCH{j}_role': 'string', f'BENCH{j}_price': 'float64'})
+SCHEMA.update({
+    'confidence': 'int64',
+    'risk_assessment': 'string',
+    'key_strengths': 'string',
+    'selection_reason': 'string'
+})
+SCHEMA.update(dict.fromkeys(['total_players', 'total_gk', 'total_def', 'total_mid', 'total_fwd'], 'int64'))
+
 def create_final_teams():
     """Create final teams CSV with proper format"""
     
@@ -20,47 +50,37 @@ def create_final_teams():
     for i, team in enumerate(selected_teams['selected_teams'], 1):
         team_data = team
         
-        # Extract players by position
-        gks = []
-        defs = []
-        mids = []
-        fwds = []
+        # Extract players by position, in one pass over the team's keys
+        positions = {'GK': [], 'DEF': [], 'MID': [], 'FWD': []}
         bench = []
+        get = team_data.get
         
-        # Process starting XI
-        for j in range(1, 12):
-            for pos in ['GK', 'DEF', 'MID', 'FWD']:
-                if f'{pos}{j}' in team_data:
-                    player_name = team_data[f'{pos}{j}']
-                    player_price = team_data.get(f'{pos}{j}_price', 0)
-                    player_score = team_data.get(f'{pos}{j}_score', 0)
-                    player_club = team_data.get(f'{pos}{j}_club', '')
-                    
-                    if player_name:
-                        player_info = f"{player_name} ({player_club})"
-                        if pos == 'GK':
-                            gks.append((player_info, player_price, player_score))
-                        elif pos == 'DEF':
-                            defs.append((player_info, player_price, player_score))
-                        elif pos == 'MID':
-                            mids.append((player_info, player_price, player_score))
-                        elif pos == 'FWD':
-                            fwds.append((player_info, player_price, player_score))
+        for key, player_name in team_data.items():
+            match = PLAYER_KEY.fullmatch(key)
+            if not match or not player_name:
+                continue
+            pos, j = match.group(1), int(match.group(2))
+            
+            # Bench
+            if pos == 'BENCH':
+                if j <= 4:
+                    bench.append((j, {
+                        'name': f"{player_name} ({get(f'{key}_club', '')})",
+                        'role': get(f'{key}_role', ''),
+                        'price': get(f'{key}_price', 0)
+                    }))
+            
+            # Starting XI
+            elif j <= 11:
+                player_info = f"{player_name} ({get(f'{key}_club', '')})"
+                positions[pos].append((j, (player_info, get(f'{key}_price', 0), get(f'{key}_score', 0))))
         
-        # Process bench
-        for j in range(1, 5):
-            if f'BENCH{j}' in team_data:
-                player_name = team_data[f'BENCH{j}']
-                player_role = team_data.get(f'BENCH{j}_role', '')
-                player_price = team_data.get(f'BENCH{j}_price', 0)
-                player_club = team_data.get(f'BENCH{j}_club', '')
-                
-                if player_name:
-                    bench.append({
-                        'name': f"{player_name} ({player_club})",
-                        'role': player_role,
-                        'price': player_price
-                    })
+        # Players in slot order within each position
+        gks, defs, mids, fwds = (
+            [player for _, player in sorted(positions[pos], key=lambda slot: slot[0])]
+            for pos in ('GK', 'DEF', 'MID', 'FWD')
+        )
+        bench = [b for _, b in sorted(bench, key=lambda slot: slot[0])]
         
         # Ensure we have exactly 15 players
         total_gk = len(gks)
@@ -139,25 +159,29 @@ def create_final_teams():
         final_teams.append(row)
     
     # Create DataFrame
-    df = pd.DataFrame(final_teams)
+    # Only the schema columns some team fills (e.g. no DEF5 columns when every
+    # team has four defenders)
+    schema = {column: dtype for column, dtype in SCHEMA.items() if any(column in row for row in final_teams)}
+    df = pd.DataFrame(final_teams, columns=list(schema)).astype(schema)
     
     # Save to CSV
     output_path = Path('../data/cached_merged_2024_2025_v2/final_selected_teams_proper_15_v2.csv')
-    df.to_csv(output_path, index=False)
+    write_csv(df, output_path)
     print(f"Saved final teams to {output_path}")
     
-    # Display summary
-    print("\nFinal Teams Summary:")
-    print("=" * 80)
+    # Display summary, collected and written to stdout in one call
+    lines = ["\nFinal Teams Summary:", "=" * 80]
     for i, row in df.iterrows():
-        print(f"\nTeam {row['rank']}:")
-        print(f"  Captain: {row['captain']}")
-        print(f"  Formation: {row['formation']}")
-        print(f"  Budget: £{row['budget']}m")
-        print(f"  5GW Score: {row['5gw_estimated']}")
-        print(f"  Risk: {row['risk_assessment']}")
-        print(f"  Confidence: {row['confidence']}%")
-        print(f"  Total Players: {row['total_players']} (GK:{row['total_gk']}, DEF:{row['total_def']}, MID:{row['total_mid']}, FWD:{row['total_fwd']})")
+        lines.append(f"\nTeam {row['rank']}:")
+        lines.append(f"  Captain: {row['captain']}")
+        lines.append(f"  Formation: {row['formation']}")
+        lines.append(f"  Budget: £{row['budget']}m")
+        lines.append(f"  5GW Score: {row['5gw_estimated']}")
+        lines.append(f"  Risk: {row['risk_assessment']}")
+        lines.append(f"  Confidence: {row['confidence']}%")
+        lines.append(f"  Total Players: {row['total_players']} (GK:{row['total_gk']}, DEF:{row['total_def']}, MID:{row['total_mid']}, FWD:{row['total_fwd']})")
+    
+    sys.stdout.write('\n'.join(lines) + '\n')
 
 if __name__ == "__main__":
     create_final_teams()
\ No newline at end of file
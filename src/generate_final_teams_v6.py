@@ -8,10 +8,36 @@ Ensures all teams have:
 - No players who left Premier League
 """
 
+import sys
 import pandas as pd
 import json
 from pathlib import Path
 
+from fpl_player_prep import write_csv
+
+# Output columns and their dtypes, declared up front so pandas neither collects
+# the keys of every row nor infers a type per column
+SCHEMA = {
+    'rank': 'int64',
+    'captain': 'string',
+    'formation': 'string',
+    'budget': 'float64',
+    'gw1_score': 'float64',
+    '5gw_estimated': 'float64',
+    'confidence': 'int64',
+    'risk_assessment': 'string',
+    'validation_passed': 'bool',
+    'fixes_applied': 'string',
+    'key_strengths': 'string',
+    'selection_reason': 'string'
+}
+for pos, count in (('GK', 2), ('DEF', 5), ('MID', 5), ('FWD', 3)):
+    for j in range(1, count + 1):
+        SCHEMA.update({f'{pos}{j}': 'string', f'{pos}{j}_price': 'float64', f'{pos}{j}_score': 'float64'})
+for j in range(1, 5):
+    SCHEMA.update({f'BENCH{j}': 'string', f'BENCH{j}_role': 'string', f'BENCH{j}_price': 'float64'})
+SCHEMA.update(dict.fromkeys(['total_players', 'total_gk', 'total_def', 'total_mid', 'total_fwd'], 'int64'))
+
 def create_final_teams():
     """Create final teams CSV with proper format from validated analysis"""
     
@@ -53,7 +79,8 @@ def create_final_teams():
                     player_num = key[len(pos):]
                     if player_num.isdigit():
                         player_name = team[key]
-                        if player_name and player_name != '' and not pd.isna(player_name):
+                        # NaN is the only value not equal to itself (a cheap pd.isna)
+                        if player_name and player_name == player_name:
                             player_data = {
                                 'name': player_name,
                                 'club': team.get(f'{key}_club', ''),
@@ -69,7 +96,7 @@ def create_final_teams():
                 bench_num = key[5:]
                 if bench_num.isdigit():
                     player_name = team[key]
-                    if player_name and player_name != '' and not pd.isna(player_name):
+                    if player_name and player_name == player_name:
                         bench.append({
                             'name': player_name,
                             'role': team.get(f'{key}_role', ''),
@@ -126,41 +153,45 @@ def create_final_teams():
         final_teams.append(row)
     
     # Create DataFrame
-    df = pd.DataFrame(final_teams)
+    # Only the schema columns some team fills (e.g. no DEF5 columns when every
+    # team has four defenders)
+    schema = {column: dtype for column, dtype in SCHEMA.items() if any(column in row for row in final_teams)}
+    df = pd.DataFrame(final_teams, columns=list(schema)).astype(schema)
     
     # Save to CSV
     output_path = Path('../data/cached_merged_2024_2025_v2/final_selected_teams_validated.csv')
-    df.to_csv(output_path, index=False)
+    write_csv(df, output_path)
     print(f"Saved validated final teams to {output_path}")
     
-    # Display summary
-    print("\nValidated Final Teams Summary:")
-    print("=" * 80)
+    # Display summary, collected and written to stdout in one call
+    lines = ["\nValidated Final Teams Summary:", "=" * 80]
     for _, row in df.iterrows():
-        print(f"\nTeam {row['rank']}:")
-        print(f"  Captain: {row['captain']} ✓")
-        print(f"  Formation: {row['formation']}")
-        print(f"  Budget: £{row['budget']}m")
-        print(f"  5GW Score: {row['5gw_estimated']}")
-        print(f"  Risk: {row['risk_assessment']}")
-        print(f"  Confidence: {row['confidence']}%")
-        print(f"  Validation: {'PASSED ✓' if row['validation_passed'] else 'FIXED'}")
+        lines.append(f"\nTeam {row['rank']}:")
+        lines.append(f"  Captain: {row['captain']} ✓")
+        lines.append(f"  Formation: {row['formation']}")
+        lines.append(f"  Budget: £{row['budget']}m")
+        lines.append(f"  5GW Score: {row['5gw_estimated']}")
+        lines.append(f"  Risk: {row['risk_assessment']}")
+        lines.append(f"  Confidence: {row['confidence']}%")
+        lines.append(f"  Validation: {'PASSED ✓' if row['validation_passed'] else 'FIXED'}")
         if row['fixes_applied']:
-            print(f"  Fixes: {row['fixes_applied']}")
-        print(f"  Squad: {row['total_players']} players (GK:{row['total_gk']}, DEF:{row['total_def']}, MID:{row['total_mid']}, FWD:{row['total_fwd']}) ✓")
-        print(f"  Reasoning: {row['selection_reason']}")
+            lines.append(f"  Fixes: {row['fixes_applied']}")
+        lines.append(f"  Squad: {row['total_players']} players (GK:{row['total_gk']}, DEF:{row['total_def']}, MID:{row['total_mid']}, FWD:{row['total_fwd']}) ✓")
+        lines.append(f"  Reasoning: {row['selection_reason']}")
         
         # Show key players
-        print("\n  Key Players:")
-        print(f"    Captain: {row['captain']}")
+        lines.append("\n  Key Players:")
+        lines.append(f"    Captain: {row['captain']}")
         if 'GK1' in row:
-            print(f"    GK: {row['GK1']}")
+            lines.append(f"    GK: {row['GK1']}")
         if 'DEF1' in row:
-            print(f"    DEF: {row['DEF1']}, {row.get('DEF2', '')}")
+            lines.append(f"    DEF: {row['DEF1']}, {row.get('DEF2', '')}")
         if 'MID1' in row and 'MID2' in row:
-            print(f"    MID: {row['MID1']}, {row.get('MID2', '')}")
+            lines.append(f"    MID: {row['MID1']}, {row.get('MID2', '')}")
         if 'FWD1' in row:
-            print(f"    FWD: {row['FWD1']}")
+            lines.append(f"    FWD: {row['FWD1']}")
+    
+    sys.stdout.write('\n'.join(lines) + '\n')
 
 if __name__ == "__main__":
     create_final_teams()
\ No newline at end of file
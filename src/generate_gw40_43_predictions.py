@@ -8,44 +8,95 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 
+from fpl_player_prep import write_table
 
-def generate_gameweek_predictions(base_predictions, gw_number):
-    """
-    Generate predictions for a specific gameweek
-    Adds some realistic variation to simulate form changes
-    """
-    gw_predictions = base_predictions.copy()
-    
-    # Add gameweek-specific adjustments
-    np.random.seed(gw_number)  # For reproducibility
-    
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+def _apply_factors_numpy(weighted_score, is_def, even_gameweek, form_noise, injury_draw, home_draw):
+    """Turn the per-gameweek draws into (G, n) scores (NumPy fallback)"""
     # Form variation (±20% random adjustment)
-    form_factor = 1 + (np.random.randn(len(gw_predictions)) * 0.1)
-    form_factor = np.clip(form_factor, 0.8, 1.2)  # Limit to ±20%
-    
-    # Apply form factor to scores
-    gw_predictions[f'gw{gw_number}_score'] = gw_predictions['weighted_score'] * form_factor
+    form_factor = np.clip(1 + (form_noise * 0.1), 0.8, 1.2)  # Limit to ±20%
     
     # Injury/rotation risk (5% chance of missing)
-    injury_mask = np.random.random(len(gw_predictions)) < 0.05
-    gw_predictions.loc[injury_mask, f'gw{gw_number}_score'] = 0
+    injured = injury_draw < 0.05
     
     # Home/away adjustments (simplified - in reality would use fixtures)
-    # 50% home, 50% away for simplicity
-    home_mask = np.random.random(len(gw_predictions)) < 0.5
-    gw_predictions.loc[home_mask, f'gw{gw_number}_score'] *= 1.1  # 10% home boost
-    gw_predictions.loc[~home_mask, f'gw{gw_number}_score'] *= 0.95  # 5% away penalty
+    # 50% home, 50% away: 10% home boost, 5% away penalty
+    home_factor = np.where(home_draw < 0.5, 1.1, 0.95)
     
     # Position-specific trends
-    # E.g., defenders might have higher clean sheet probability some weeks
-    if gw_number % 2 == 0:  # Even gameweeks
-        def_mask = gw_predictions['role'] == 'DEF'
-        gw_predictions.loc[def_mask, f'gw{gw_number}_score'] *= 1.15
+    # E.g., defenders might have higher clean sheet probability in even gameweeks
+    position_factor = np.where(even_gameweek[:, None] & is_def[None, :], 1.15, 1.0)
+    
+    # Apply all factors, in the same order as the column updates they replace
+    score = weighted_score[None, :] * form_factor
+    score[injured] = 0
+    score *= home_factor
+    score *= position_factor
     
     # Ensure non-negative scores
-    gw_predictions[f'gw{gw_number}_score'] = gw_predictions[f'gw{gw_number}_score'].clip(lower=0)
+    return np.clip(score, 0, None)
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _apply_factors(weighted_score, is_def, even_gameweek, form_noise, injury_draw, home_draw):
+        """Turn the per-gameweek draws into (G, n) scores
+
+        All factors are applied in one pass per score, in the same order as
+        the NumPy version, so the results are identical (NaN base scores
+        stay NaN unless the player is injured).
+        """
+        n_gw, n = form_noise.shape
+        score = np.empty((n_gw, n))
+        for k in prange(n_gw * n):
+            g = k // n
+            i = k % n
+            s = weighted_score[i] * min(max(1 + form_noise[g, i] * 0.1, 0.8), 1.2)
+            if injury_draw[g, i] < 0.05:
+                s = 0.0
+            s *= 1.1 if home_draw[g, i] < 0.5 else 0.95
+            if even_gameweek[g] and is_def[i]:
+                s *= 1.15
+            score[g, i] = 0.0 if s < 0 else s
+        return score
+else:
+    _apply_factors = _apply_factors_numpy
+
+
+def compute_gw_scores(weighted_score, is_def, gameweeks):
+    """
+    Generate predicted scores for several gameweeks
+    Adds some realistic variation to simulate form changes
     
-    return gw_predictions
+    Takes the base weighted_score array and a boolean defender mask (built
+    once by the caller) and returns a (len(gameweeks), n) array of scores, all
+    gameweeks scored together by _apply_factors. Each gameweek draws from its
+    own Generator seeded with the gameweek number, so no state is shared
+    between gameweeks or threads.
+    """
+    n = len(weighted_score)
+    
+    # Per gameweek (for reproducibility): form draws, then the injury and home
+    # draws, which follow each other in the stream and come from one call
+    form_noise = np.empty((len(gameweeks), n))
+    uniform = np.empty((len(gameweeks), 2, n))
+    for g, gw in enumerate(gameweeks):
+        rng = np.random.default_rng(gw)
+        form_noise[g] = rng.standard_normal(n)
+        uniform[g] = rng.random((2, n))
+    injury_draw, home_draw = uniform[:, 0], uniform[:, 1]
+    
+    even_gameweek = np.asarray(gameweeks) % 2 == 0
+    return _apply_factors(
+        weighted_score, np.asarray(is_def, dtype=np.bool_), even_gameweek,
+        form_noise, injury_draw, home_draw
+    )
 
 
 def main():
@@ -56,23 +107,38 @@ def main():
         return
     
     print("Loading base predictions...")
-    base_predictions = pd.read_csv(predictions_file)
-    
-    # Generate predictions for GW40-43
-    all_predictions = base_predictions.copy()
-    
-    for gw in range(40, 44):
-        print(f"Generating predictions for GW{gw}...")
-        gw_preds = generate_gameweek_predictions(base_predictions, gw)
-        all_predictions[f'gw{gw}_score'] = gw_preds[f'gw{gw}_score']
-    
-    # Calculate 4GW total (GW40-43)
-    gw_cols = [f'gw{gw}_score' for gw in range(40, 44)]
-    all_predictions['gw40_43_total'] = all_predictions[gw_cols].sum(axis=1)
+    # Declared dtypes skip type inference; roles and clubs repeat, so they are
+    # categorical (float32 would change the written scores, so floats stay 64-bit)
+    all_predictions = pd.read_csv(
+        predictions_file,
+        dtype={
+            'first_name': 'str',
+            'last_name': 'str',
+            'role': 'category',
+            'club': 'category',
+            'price': 'float64',
+            'weighted_score': 'float64'
+        }
+    )
+    
+    # Generate predictions for GW40-43, added as new columns of the loaded frame
+    # (nothing else reads it, so it is not copied first)
+    gameweeks = range(40, 44)
+    gw_cols = [f'gw{gw}_score' for gw in gameweeks]
+    print("Generating predictions for GW40-43...")
+    scores = compute_gw_scores(
+        all_predictions['weighted_score'].to_numpy(dtype=np.float64),
+        (all_predictions['role'] == 'DEF').to_numpy(),
+        gameweeks
+    )
+    all_predictions[gw_cols] = scores.T
+    
+    # Calculate 4GW total (GW40-43; a missing score counts as 0)
+    all_predictions['gw40_43_total'] = np.nansum(scores, axis=0)
     
     # Save enhanced predictions
     output_file = Path("/Users/huetuanthi/dev/dokeai/fpl/data/cached_merged_2024_2025_v3/predictions_gw40_43.csv")
-    all_predictions.to_csv(output_file, index=False)
+    write_table(all_predictions, output_file)
     print(f"\nSaved predictions to: {output_file}")
     
     # Show top players for GW40-43
@@ -81,28 +147,26 @@ def main():
         ['first_name', 'last_name', 'role', 'club', 'price', 'gw40_43_total'] + gw_cols
     ]
     
-    for idx, player in top_players.iterrows():
-        name = f"{player['first_name']} {player['last_name']}"
-        print(f"{name:25} {player['role']:3} {player['club']:15} £{player['price']:4.1f}m  Total: {player['gw40_43_total']:5.1f}")
+    for player in top_players.itertuples(index=False):
+        name = f"{player.first_name} {player.last_name}"
+        print(f"{name:25} {player.role:3} {player.club:15} £{player.price:4.1f}m  Total: {player.gw40_43_total:5.1f}")
     
-    # Show players with biggest changes from base
-    all_predictions['change_from_base'] = all_predictions['gw40_43_total'] / 4 - all_predictions['weighted_score']
+    # Show players with biggest changes from base (ranked on just the columns
+    # shown, so the wide predictions frame is not extended or copied)
+    changes = all_predictions[['first_name', 'last_name', 'role', 'club', 'weighted_score', 'gw40_43_total']]
+    changes = changes.assign(change_from_base=changes['gw40_43_total'] / 4 - changes['weighted_score'])
     
     print("\n\nBiggest risers (form improvement):")
-    risers = all_predictions.nlargest(10, 'change_from_base')[
-        ['first_name', 'last_name', 'role', 'club', 'weighted_score', 'gw40_43_total', 'change_from_base']
-    ]
-    for idx, player in risers.iterrows():
-        name = f"{player['first_name']} {player['last_name']}"
-        print(f"{name:25} Base: {player['weighted_score']:4.2f} -> Avg: {player['gw40_43_total']/4:4.2f} (+{player['change_from_base']:4.2f})")
+    risers = changes.nlargest(10, 'change_from_base')
+    for player in risers.itertuples(index=False):
+        name = f"{player.first_name} {player.last_name}"
+        print(f"{name:25} Base: {player.weighted_score:4.2f} -> Avg: {player.gw40_43_total/4:4.2f} (+{player.change_from_base:4.2f})")
     
     print("\n\nBiggest fallers (form decline/injury):")
-    fallers = all_predictions.nsmallest(10, 'change_from_base')[
-        ['first_name', 'last_name', 'role', 'club', 'weighted_score', 'gw40_43_total', 'change_from_base']
-    ]
-    for idx, player in fallers.iterrows():
-        name = f"{player['first_name']} {player['last_name']}"
-        print(f"{name:25} Base: {player['weighted_score']:4.2f} -> Avg: {player['gw40_43_total']/4:4.2f} ({player['change_from_base']:4.2f})")
+    fallers = changes.nsmallest(10, 'change_from_base')
+    for player in fallers.itertuples(index=False):
+        name = f"{player.first_name} {player.last_name}"
+        print(f"{name:25} Base: {player.weighted_score:4.2f} -> Avg: {player.gw40_43_total/4:4.2f} ({player.change_from_base:4.2f})")
 
 
 if __name__ == "__main__":
@@ -13,6 +13,8 @@ import json
 from copy import deepcopy
 import random
 
+from fpl_player_prep import read_table
+
 
 class TransferOptimizer:
     def __init__(self, initial_team, player_predictions):
@@ -321,7 +323,7 @@ def main():
         print(f"Error: {predictions_file} not found")
         return
     
-    predictions_df = pd.read_csv(predictions_file)
+    predictions_df = read_table(predictions_file)
     predictions_df['player_name'] = predictions_df['first_name'] + ' ' + predictions_df['last_name']
     
     # Load best teams
@@ -14,6 +14,8 @@ import json
 from copy import deepcopy
 import random
 
+from fpl_player_prep import read_table
+
 
 class EnhancedTransferOptimizer:
     def __init__(self, initial_team, player_predictions):
@@ -447,7 +449,7 @@ def main():
         print(f"Error: {predictions_file} not found")
         return
     
-    predictions_df = pd.read_csv(predictions_file)
+    predictions_df = read_table(predictions_file)
     predictions_df['player_name'] = predictions_df['first_name'] + ' ' + predictions_df['last_name']
     
     # Load best teams
@@ -1,7 +1,17 @@
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 from dataclasses import dataclass
 from collections import defaultdict
+from operator import itemgetter
+import heapq
 import itertools
+import math
+
+def _pool_size(required, expansions):
+    """Smallest number of candidates with at least `expansions` combinations of `required`"""
+    size = required
+    while math.comb(size, required) < expansions:
+        size += 1
+    return size
 
 @dataclass(frozen=True)  # Make it hashable
 class Player:
@@ -102,8 +112,13 @@ class OptimizedFantasyOptimizer:
         
         return best_11, best_score
     
-    def _generate_top_teams_beam_search(self, beam_width: int = 1000, max_results: int = 5000):
-        """Use beam search to find top team combinations efficiently."""
+    def _generate_top_teams_beam_search(self, beam_width: int = 1000, max_results: int = 5000,
+                                        per_hyp_expansions: Optional[int] = None):
+        """Use beam search to find top team combinations efficiently.
+        If per_hyp_expansions is set, each hypothesis only draws its new players from
+        the most efficient (score/price) candidates of the role, just enough of them
+        to form that many combinations, and keeps at most that many valid states:
+        the best ones by total player score."""
         # State: (cost, team_players, counts_by_role)
         initial_state = (0.0, [], {role: 0 for role in self.role_requirements_15})
         beam = [initial_state]
@@ -121,12 +136,6 @@ class OptimizedFantasyOptimizer:
                 if len(available) < required:
                     continue
                 
-                # Count current team composition
-                team_counts = defaultdict(int)
-                for p in team:
-                    if p.team:
-                        team_counts[p.team] += 1
-                
                 # For large numbers, sample combinations intelligently
                 if len(available) > 20 and required > 3:
                     # Use top players by score and some by efficiency
@@ -136,37 +145,17 @@ class OptimizedFantasyOptimizer:
                 else:
                     candidates = available
                 
-                # Generate combinations
-                for combo in itertools.combinations(candidates, required):
-                    # Check team constraint
-                    temp_team_counts = team_counts.copy()
-                    valid_team_constraint = True
-                    for p in combo:
-                        if p.team:
-                            temp_team_counts[p.team] += 1
-                            if temp_team_counts[p.team] > self.max_players_per_team:
-                                valid_team_constraint = False
-                                break
-                    
-                    if not valid_team_constraint:
-                        continue
-                    
-                    new_cost = cost + sum(p.price for p in combo)
-                    
-                    # Prune if over budget
-                    if new_cost > self.budget:
-                        continue
-                    
-                    # Estimate if we can complete the team within budget
-                    new_counts = counts.copy()
-                    new_counts[role] = required
-                    min_remaining = self._estimate_min_remaining_cost(new_counts)
-                    
-                    if new_cost + min_remaining > self.budget:
-                        continue
-                    
-                    new_team = team + list(combo)
-                    next_beam.append((new_cost, new_team, new_counts))
+                if per_hyp_expansions is not None:
+                    # Cut the pool before taking combinations, so fewer are generated
+                    candidates = sorted(candidates, key=lambda p: p.efficiency, reverse=True)
+                    candidates = candidates[:_pool_size(required, per_hyp_expansions)]
+                
+                expansions = self._expand_hypothesis(
+                    cost, team, counts, role, required, candidates, sum(p.score for p in team)
+                )
+                if per_hyp_expansions is not None:
+                    expansions = heapq.nlargest(per_hyp_expansions, expansions, key=itemgetter(0))
+                next_beam.extend(state for _, state in expansions)
             
             # Keep top entries by potential (could sort by score heuristic)
             if len(next_beam) > beam_width:
@@ -182,6 +171,44 @@ class OptimizedFantasyOptimizer:
         
         return complete_teams[:max_results]
     
+    def _expand_hypothesis(self, cost, team, counts, role, required, candidates, team_score):
+        """Yield (score, state) for the valid states that add `required` players of
+        `role` to a hypothesis: team constraint met and the team still completable
+        within budget. The score is team_score (the hypothesis' total player score)
+        plus the new players' scores."""
+        # Count current team composition
+        team_counts = defaultdict(int)
+        for p in team:
+            if p.team:
+                team_counts[p.team] += 1
+        
+        new_counts = counts.copy()
+        new_counts[role] = required
+        min_remaining = self._estimate_min_remaining_cost(new_counts)
+        
+        # Generate combinations
+        for combo in itertools.combinations(candidates, required):
+            # Check team constraint
+            temp_team_counts = team_counts.copy()
+            valid_team_constraint = True
+            for p in combo:
+                if p.team:
+                    temp_team_counts[p.team] += 1
+                    if temp_team_counts[p.team] > self.max_players_per_team:
+                        valid_team_constraint = False
+                        break
+            
+            if not valid_team_constraint:
+                continue
+            
+            new_cost = cost + sum(p.price for p in combo)
+            
+            # Prune if over budget, or if we cannot complete the team within budget
+            if new_cost > self.budget or new_cost + min_remaining > self.budget:
+                continue
+            
+            yield team_score + sum(p.score for p in combo), (new_cost, team + list(combo), new_counts)
+    
     def find_top_combinations_optimized(self, top_k: int = 50) -> List[Dict]:
         """Find top K combinations using optimized beam search."""
         # Generate candidate teams
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""Tests for the Bradley-Terry fit cache in fpl_week_sampling_with_roles"""
+
+from fpl_week_sampling_with_roles import _save_fits, _load_fits
+
+
+def test_fits_round_trip_mixed_keys(tmp_path):
+    # Merged data: string team names alongside int opponent_team ids
+    fits = {
+        'team': {'Arsenal': 1.5, 3: 0.75, 'Chelsea': 0.25},
+        'player_roles': {101: 'MID', 202: 'DEF'}
+    }
+    path = tmp_path / 'fits.npz'
+    
+    _save_fits(path, fits)
+    loaded = _load_fits(path)
+    
+    assert loaded == fits
+    assert list(loaded['team']) == ['Arsenal', 3, 'Chelsea']
+    assert all(type(key) is int for key in loaded['player_roles'])
@@ -9,8 +9,8 @@ Example: python src/visualize_bradley_terry.py 2024 weeks_1_to_9
 import sys
 import numpy as np
 import pandas as pd
-import json
 from pathlib import Path
+from fpl_player_prep import load_bt_matrix, load_player_mappings
 
 
 def load_bradley_terry_data(season_year, suffix="all_weeks"):
@@ -19,13 +19,11 @@ def load_bradley_terry_data(season_year, suffix="all_weeks"):
     bt_dir = Path("data") / f"{season_year}" / "bradley_terry"
     
     # Load matrix
-    matrix_file = bt_dir / f"bt_matrix_{suffix}.npy"
-    bt_matrix = np.load(matrix_file)
+    # Matrix is stored as uint16; widen it so dot products and sums cannot overflow
+    bt_matrix = load_bt_matrix(bt_dir, suffix).astype(np.int64)
     
     # Load mappings
-    mappings_file = bt_dir / f"player_mappings_{suffix}.json"
-    with open(mappings_file, 'r') as f:
-        mappings = json.load(f)
+    mappings = load_player_mappings(bt_dir, suffix)
     
     # Load analysis
     analysis_file = bt_dir / f"matrix_analysis_{suffix}.csv"